@@ -0,0 +1,209 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (CAST_LIST_QUERY, CAST_VIEW_QUERY, COLUMNS, DB_PATH, DEFAULT_PROFILE, PAGE_SIZE, STATEMENTS,
+                      apply_batch, cast_cache, cast_view_enabled, coerce_row, connect, forget_cast_lists, initialize)
+
+
+class AsyncDatabase:
+    """
+    Run queries on worker threads so they don't block the event loop.
+
+    Reads run on a pool of threads, each with its own read-only connection,
+    so several can happen at once. Writes all go through one thread with
+    the only writable connection, so they happen one at a time.
+
+        async with AsyncDatabase() as db:
+            cast = await db.cast_list(3)
+    """
+
+    def __init__(self, path=DB_PATH, readers=4, profile=DEFAULT_PROFILE):
+        self.path = path
+        self.profile = profile
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="lb-read")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lb-write")
+        self.local = threading.local()
+        self.reader_connections = []
+        self.lock = threading.Lock()
+        # Whether the file has show_cast_view, checked on the first cast list
+        self.cast_view = None
+
+        # Readers can't create tables, so make sure they're there first
+        initialize(path)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def reader_connection(self):
+        # Open a connection the first time each thread needs one
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = connect(self.path, self.profile, read_only=True)
+            self.local.connection = connection
+            with self.lock:
+                self.reader_connections.append(connection)
+        return connection
+
+    def writer_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = connect(self.path, self.profile)
+            self.local.connection = connection
+        return connection
+
+    async def read(self, function, *args):
+        """
+        Run function(connection, *args) on a reader thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers, lambda: function(self.reader_connection(), *args))
+
+    async def write(self, function, *args):
+        """
+        Run function(connection, *args) on the writer thread and commit, or
+        roll back if it fails.
+        """
+        def run():
+            connection = self.writer_connection()
+            try:
+                result = function(connection, *args)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            return result
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, run)
+
+    async def view(self, table, after=0, limit=PAGE_SIZE):
+        """
+        Get a page of rows from a table, ordered by ID and starting after
+        the given ID.
+        """
+        check_table(table)
+        return await self.read(lambda connection: connection.execute(STATEMENTS[table]["page"], [after, limit]).fetchall())
+
+    async def cast_list(self, showId):
+        """
+        Get the cast list for a show, from the cache if we've seen it before.
+        """
+        showId = int(showId)
+        records = cast_cache.get(showId)
+        if records is None:
+            # A write can drop the list while it's being read, and the
+            # list read before it mustn't go back in the cache
+            generation = cast_cache.generation
+
+            def cast_list(connection):
+                if self.cast_view is None:
+                    self.cast_view = cast_view_enabled(connection)
+                query = CAST_VIEW_QUERY if self.cast_view else CAST_LIST_QUERY
+                return tuple(connection.execute(query, [showId]).fetchall())
+
+            records = await self.read(cast_list)
+            cast_cache.put(showId, records, generation)
+        return records
+
+    async def add(self, table, **values):
+        """
+        Add a row to a table, given its columns as keywords. Returns the ID
+        of the new row.
+        """
+        check_table(table, values)
+
+        def add(connection):
+            row = coerce_row(table, COLUMNS[table], [values.get(column) for column in COLUMNS[table]], connection)
+            return connection.execute(STATEMENTS[table]["insert"], row).lastrowid
+
+        key = await self.write(add)
+        if table == "cast_list":
+            forget_cast_lists(table, [values.get("showId")])
+        else:
+            forget_cast_lists(table)
+        return key
+
+    async def update(self, table, key, **values):
+        """
+        Change some of the columns of a row, given as keywords. Columns that
+        aren't given keep their current values.
+        """
+        check_table(table, values)
+
+        def update(connection):
+            statements = STATEMENTS[table]
+            currentinfo = connection.execute(statements["select"], [key]).fetchone()
+            if currentinfo is None:
+                raise KeyError(f"No row with ID {key} in the {table} table.")
+            fields = COLUMNS[table][1:]
+            row = coerce_row(table, fields, [values.get(field, current) for field, current in zip(fields, currentinfo)],
+                             connection)
+            connection.execute(statements["update"], row + [key])
+            return currentinfo
+
+        currentinfo = await self.write(update)
+        if table == "cast_list":
+            # The listing may have moved from one show to another
+            forget_cast_lists(table, [currentinfo[0], values.get("showId", currentinfo[0])])
+        else:
+            forget_cast_lists(table)
+
+    async def delete(self, table, key):
+        """
+        Remove a row from a table by its ID.
+        """
+        check_table(table)
+
+        def delete(connection):
+            currentinfo = connection.execute(STATEMENTS[table]["select"], [key]).fetchone()
+            connection.execute(STATEMENTS[table]["delete"], [key])
+            return currentinfo
+
+        currentinfo = await self.write(delete)
+        if table == "cast_list":
+            forget_cast_lists(table, [currentinfo[0]] if currentinfo else [])
+        else:
+            forget_cast_lists(table)
+
+    async def batch(self, table, inserts=(), updates=(), deletes=(), all_or_nothing=False):
+        """
+        Add, change and delete many rows in one transaction. See
+        database.apply_batch.
+        """
+        check_table(table)
+        return await self.write(lambda connection: apply_batch(table, inserts, updates, deletes, all_or_nothing,
+                                                               connection))
+
+    async def close(self):
+        """
+        Finish any queued work and close every connection.
+        """
+        loop = asyncio.get_running_loop()
+
+        def close_writer():
+            connection = getattr(self.local, "connection", None)
+            if connection is not None:
+                connection.close()
+
+        await loop.run_in_executor(self.writer, close_writer)
+        self.writer.shutdown()
+        self.readers.shutdown()
+        # Read-only connections can be closed from any thread
+        for connection in self.reader_connections:
+            connection.close()
+        self.reader_connections = []
+
+
+def check_table(table, values=()):
+    """
+    Make sure a table and its columns exist before building any SQL.
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    unknown = set(values) - set(COLUMNS[table][1:])
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+
+# Average number of cast members listed for each show
+CAST_PER_SHOW = 20
+
+# How often each kind of cover goes on, out of 100 listings
+COVER_TYPES = ["actor"] * 85 + ["understudy"] * 8 + ["swing"] * 4 + ["standby"] * 2 + ["emergency cover"]
+
+LOCATIONS = ["New York", "Chicago", "Los Angeles", "London", "Toronto", "Melbourne", "Seoul", "Manila"]
+
+
+def table_sizes(cast_rows):
+    """
+    Work out how many rows each table needs for a given cast list size.
+    """
+    shows = max(1, cast_rows // CAST_PER_SHOW)
+    actors = max(50, cast_rows // 200)
+    return {
+        "productions": max(1, shows // 1000),
+        "shows": shows,
+        "characters": max(40, cast_rows // 10000),
+        "actors": actors,
+        "actor_is_char": actors * 2,
+        "cast_list": cast_rows,
+    }
+
+
+def generate(table, sizes, rng):
+    """
+    Make up rows for a table. The same seed always gives the same rows.
+    """
+    count = sizes[table]
+    if table == "productions":
+        for i in range(count):
+            start = 1990 + rng.randrange(35)
+            yield {"prodName": f"Production {i + 1}", "prodStartYr": start, "prodEndYr": start + rng.randrange(1, 6)}
+    elif table == "shows":
+        for _ in range(count):
+            yield {
+                "prodId": rng.randint(1, sizes["productions"]),
+                "date": f"{rng.randint(1990, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "time": rng.choice("ME"),
+                "location": rng.choice(LOCATIONS),
+            }
+    elif table == "characters":
+        for i in range(count):
+            yield {"fName": f"Character{i + 1}", "lName": f"Surname{rng.randrange(500)}", "title": "", "suffix": ""}
+    elif table == "actors":
+        for i in range(count):
+            yield {"fName": f"Actor{i + 1}", "lName": f"Surname{rng.randrange(5000)}"}
+    elif table == "actor_is_char":
+        for _ in range(count):
+            yield {"actorId": rng.randint(1, sizes["actors"]), "charId": rng.randint(1, sizes["characters"])}
+    elif table == "cast_list":
+        for i in range(count):
+            yield {
+                "showId": i // CAST_PER_SHOW + 1,
+                "acId": rng.randint(1, sizes["actor_is_char"]),
+                "type": rng.choice(COVER_TYPES),
+            }
+
+
+def summarize(times):
+    """
+    Turn a list of timings in seconds into summary statistics.
+    """
+    total = sum(times)
+    ordered = sorted(times)
+    return {
+        "count": len(times),
+        "seconds": round(total, 6),
+        "per_sec": round(len(times) / total, 1) if total > 0 else None,
+        "mean_ms": round(statistics.mean(times) * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+    }
+
+
+def time_operation(operation, repeat):
+    """
+    Run an operation a number of times and time each run.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        operation(i)
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(database, bulk_import, cast_rows, seed, repeat, views, cast_view):
+    """
+    Fill the database with synthetic data and time each kind of operation.
+    """
+    rng = random.Random(seed)
+    sizes = table_sizes(cast_rows)
+    results = {}
+
+    connection = database.get_connection()
+
+    # Load every table in bulk
+    database.apply_profile(connection, "bulk-load")
+    for table in sizes:
+        start = time.perf_counter()
+        total = bulk_import.import_rows(table, generate(table, sizes, rng))
+        elapsed = time.perf_counter() - start
+        results[f"bulk_insert.{table}"] = {"rows": total, "seconds": round(elapsed, 6), "per_sec": round(total / elapsed, 1)}
+    database.apply_profile(connection, database.DEFAULT_PROFILE)
+    if cast_view:
+        database.enable_cast_view()
+    connection.execute("ANALYZE")
+
+    cursor = connection.cursor()
+    shows = sizes["shows"]
+    statements = database.STATEMENTS["cast_list"]
+
+    # One row and one commit at a time, the way add_data works
+    def insert(i):
+        values = database.coerce_row("cast_list", database.COLUMNS["cast_list"], [None, rng.randint(1, shows), 1, "understudy"])
+        cursor.execute(statements["insert"], values)
+        connection.commit()
+    results["insert"] = time_operation(insert, repeat)
+
+    # Cast list for one show, straight from the database
+    def cast_query(i):
+        database.cast_cache.clear()
+        database.get_cast_list(rng.randint(1, shows))
+    results["cast_query"] = time_operation(cast_query, repeat)
+
+    # Cast list for a small set of popular shows, mostly from the cache
+    popular = [rng.randint(1, shows) for _ in range(min(shows, 100))]
+    database.cast_cache.clear()
+    results["cast_query_cached"] = time_operation(lambda i: database.get_cast_list(rng.choice(popular)), repeat)
+
+    def update(i):
+        castListId = rng.randint(1, cast_rows)
+        cursor.execute(statements["select"], [castListId])
+        showId, acId, type = cursor.fetchone()
+        type = database.coerce_value("cast_list", "type", rng.choice(COVER_TYPES))
+        cursor.execute(statements["update"], [showId, acId, type, castListId])
+        connection.commit()
+    results["update"] = time_operation(update, repeat)
+
+    # Delete distinct rows so every delete actually removes something
+    deleted = rng.sample(range(1, cast_rows + 1), min(repeat, cast_rows))
+    def delete(i):
+        cursor.execute(statements["delete"], [deleted[i]])
+        connection.commit()
+    results["delete"] = time_operation(delete, len(deleted))
+
+    # Whole table through view_data, with the output thrown away
+    if views:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for table in database.COLUMNS:
+                results[f"view.{table}"] = time_operation(lambda i: database.view_data(table), 1)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "profile": database.DEFAULT_PROFILE,
+        "cast_view": cast_view,
+        "seed": seed,
+        "cast_rows": cast_rows,
+        "sizes": sizes,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """
+    Print how each timing changed between two benchmark results.
+    """
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        print(f"{name:32} {before['seconds']:12.4f}s {result['seconds']:12.4f}s {ratio:8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database with synthetic data.")
+    parser.add_argument("--cast-rows", type=int, default=100000, help="number of cast list rows to generate (1000 to 10000000)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the generated data")
+    parser.add_argument("--repeat", type=int, default=200, help="times to run each single-row operation")
+    parser.add_argument("--db", default="benchmark.db", help="scratch database file, replaced on every run")
+    parser.add_argument("--no-views", action="store_true", help="skip the full-table views")
+    parser.add_argument("--cast-view", action="store_true", help="read cast lists from the precomputed show_cast_view table")
+    parser.add_argument("--output", help="write the JSON results to a file instead of the screen")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath("legally-blonde.db"):
+        parser.error("refusing to overwrite the real database")
+
+    # Start from an empty file every time
+    for path in (args.db, args.db + "-wal", args.db + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # The database module reads LB_DB_PATH when it's imported, so point it
+    # at the scratch file first
+    os.environ["LB_DB_PATH"] = args.db
+    import bulk_import
+    import database
+
+    report = run(database, bulk_import, args.cast_rows, args.seed, args.repeat, not args.no_views, args.cast_view)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import csv
+import json
+import sqlite3
+import time
+
+from database import apply_profile, cast_cache, coerce_row, get_connection, names, CAST_LIST_TABLES, COLUMNS, PROFILES
+
+# Number of rows to insert with each executemany call
+BATCH_SIZE = 50000
+
+
+def read_csv(path):
+    """
+    Read rows from a CSV file with a header line of column names.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            yield row
+
+
+def read_jsonl(path):
+    """
+    Read rows from a file with one JSON object per line.
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_rows(path):
+    """
+    Pick the reader for a file based on its extension.
+    """
+    if path.endswith(".csv"):
+        return read_csv(path)
+    elif path.endswith(".jsonl") or path.endswith(".ndjson"):
+        return read_jsonl(path)
+    else:
+        raise ValueError(f"Don't know how to read {path}. Use a .csv or .jsonl file.")
+
+
+def import_rows(table, rows, batch_size=BATCH_SIZE):
+    """
+    Insert rows (dicts of column name to value) into a table in large batches.
+    Returns the number of rows inserted.
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+
+    # Only insert the columns the data actually has, so IDs are generated
+    # when they're left out
+    columns = [column for column in COLUMNS[table] if column in first]
+    unknown = set(first) - set(COLUMNS[table])
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+
+    qmarks = ", ".join("?" for _ in columns)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({qmarks})"
+
+    def values(number, row):
+        # Store IDs as numbers, dates as days and times and types as IDs.
+        # Files from export.py have dates as days already.
+        try:
+            return coerce_row(table, columns, [row.get(column) for column in columns], exported=True)
+        except ValueError as error:
+            raise ValueError(f"Row {number}: {error}")
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    total = 0
+    batch = [values(1, first)]
+    for number, row in enumerate(rows, 2):
+        batch.append(values(number, row))
+        if len(batch) >= batch_size:
+            total += insert_batch(cursor, sql, batch)
+            batch = []
+    if batch:
+        total += insert_batch(cursor, sql, batch)
+
+    # Too many shows may have changed to drop them one at a time
+    if table in CAST_LIST_TABLES:
+        cast_cache.clear()
+    # Imported IDs can fill gaps below the last ID the name directory has
+    names.forget(table)
+
+    return total
+
+
+def insert_batch(cursor, sql, batch):
+    """
+    Insert one batch of rows in a single transaction.
+    """
+    try:
+        cursor.executemany(sql, batch)
+        cursor.connection.commit()
+    except sqlite3.Error:
+        cursor.connection.rollback()
+        raise
+    return len(batch)
+
+
+def import_file(table, path, batch_size=BATCH_SIZE):
+    """
+    Load a CSV or JSONL file into a table and report how fast it went.
+    """
+    start = time.perf_counter()
+    total = import_rows(table, read_rows(path), batch_size)
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"Imported {total} rows into the {table.upper()} table in {elapsed:.2f}s ({rate:,.0f} rows/sec).")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load CSV or JSONL files into the database.")
+    parser.add_argument("table", choices=sorted(COLUMNS), help="the table to load into")
+    parser.add_argument("files", nargs="+", help="CSV or JSONL files, with column names matching the table")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--profile", choices=PROFILES, default="bulk-load", help="connection settings to use")
+    args = parser.parse_args()
+
+    apply_profile(get_connection(), args.profile)
+
+    for path in args.files:
+        try:
+            import_file(args.table, path, args.batch_size)
+        except ValueError as error:
+            parser.exit(1, f"{path}: {error}\n")
+
+
+if __name__ == "__main__":
+    main()
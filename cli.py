@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# Output formats for rows. Results of writes are always one JSON object.
+ROW_FORMATS = ["jsonl", "csv", "tsv"]
+
+
+def write_rows(columns, rows, fmt, out=sys.stdout):
+    """
+    Write rows to stdout as JSON lines, CSV or tab separated values.
+    """
+    if fmt == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row))) + "\n")
+    else:
+        writer = csv.writer(out, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def write_result(result, out=sys.stdout):
+    out.write(json.dumps(result) + "\n")
+
+
+def parse_values(pairs):
+    """
+    Turn ["column=value", ...] into a dict.
+    """
+    values = {}
+    for pair in pairs:
+        column, equals, value = pair.partition("=")
+        if not equals or not column:
+            raise ValueError(f"Expected column=value, got {pair!r}.")
+        values[column.strip()] = value
+    return values
+
+
+def read_stdin_rows():
+    """
+    Read rows to import from stdin, one JSON object per line.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def view(database, args):
+    """
+    Print the chosen columns and rows of a table.
+    """
+    columns = [column.strip() for column in args.columns.split(",")] if args.columns else None
+    order_by = [column.strip() for column in args.sort.split(",")] if args.sort else None
+    filters = database.parse_filters(args.where) if args.where else None
+    sql, params = database.build_select(args.table, columns, order_by, filters, args.limit)
+
+    cursor = database.get_connection().cursor()
+    cursor.execute(sql, params)
+    headers = columns or database.COLUMNS[args.table]
+    # Stream the rows rather than reading the whole table first
+    batches = iter(lambda: cursor.fetchmany(database.PAGE_SIZE), [])
+    write_rows(headers, (row for rows in batches for row in rows), args.format)
+    cursor.close()
+
+
+def add(database, args):
+    """
+    Add one row and print its ID.
+    """
+    values = parse_values(args.values)
+    table = args.table
+    if table not in database.COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    unknown = set(values) - set(database.COLUMNS[table])
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+
+    connection = database.get_connection()
+    columns = [column for column in database.COLUMNS[table] if column in values]
+    row = database.coerce_row(table, columns, [values[column] for column in columns])
+    cursor = connection.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({database.get_qmarks(columns)})",
+                                row)
+    connection.commit()
+    write_result({"table": table, "added": cursor.lastrowid})
+
+
+def update(database, args):
+    """
+    Change some columns of one row.
+    """
+    table = args.table
+    if table not in database.COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    values = parse_values(args.values)
+    values[database.COLUMNS[table][0]] = args.id
+    report = database.apply_batch(table, updates=[values], all_or_nothing=True)
+    write_result({"table": table, "updated": report["updated"]})
+
+
+def delete(database, args):
+    """
+    Delete rows by ID.
+    """
+    report = database.apply_batch(args.table, deletes=args.ids, all_or_nothing=True)
+    write_result({"table": args.table, "deleted": report["deleted"]})
+
+
+def cast(database, args):
+    """
+    Print the cast lists of one or more shows.
+    """
+    rows = []
+    for showId in args.showIds:
+        rows.extend((showId,) + tuple(record) for record in database.get_cast_list(showId))
+    write_rows(["showId", "character", "actor", "type"], rows, args.format)
+
+
+def import_(database, args):
+    """
+    Bulk load files, or JSON lines from stdin when the file is -.
+    """
+    import bulk_import
+
+    # Loading is faster with the bulk-load settings, unless others were asked for
+    database.apply_profile(database.get_connection(), args.profile or "bulk-load")
+    for path in args.files:
+        start = time.perf_counter()
+        rows = read_stdin_rows() if path == "-" else bulk_import.read_rows(path)
+        total = bulk_import.import_rows(args.table, rows, args.batch_size)
+        write_result({"table": args.table, "file": path, "imported": total,
+                      "seconds": round(time.perf_counter() - start, 6)})
+
+
+def export(database, args):
+    """
+    Export tables or cast lists to files.
+    """
+    import export
+
+    names = list(database.COLUMNS) + [export.CAST_LISTS]
+    unknown = [name for name in args.names if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown table {unknown[0]}. Choose from: {', '.join(names)}")
+
+    database.initialize(database.DB_PATH)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.names or names:
+        out, total, elapsed = export.timed_export(name, args.format, args.output_dir, args.gzip, database.DB_PATH,
+                                                 args.workers)
+        write_result({"name": name, "file": out, "exported": total, "seconds": round(elapsed, 6)})
+
+
+COMMANDS = {
+    "view": view,
+    "add": add,
+    "update": update,
+    "delete": delete,
+    "cast": cast,
+    "import": import_,
+    "export": export,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run one operation on the database without any prompts.")
+    parser.add_argument("--db", help="database file to use (default: LB_DB_PATH or legally-blonde.db)")
+    parser.add_argument("--profile", help="connection settings to use (default: LB_DB_PROFILE or interactive)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("view", help="print rows of a table")
+    command.add_argument("table")
+    command.add_argument("--columns", help="columns to print, separated by commas")
+    command.add_argument("--sort", help="columns to sort by, separated by commas, with - in front to sort descending (e.g. --sort=-date)")
+    command.add_argument("--where", help='filters, e.g. "date >= 2008-01-01 and location = New York"')
+    command.add_argument("--limit", type=int, help="most rows to print")
+    command.add_argument("--format", choices=ROW_FORMATS, default="jsonl", help="output format")
+
+    command = commands.add_parser("add", help="add a row and print its ID")
+    command.add_argument("table")
+    command.add_argument("values", nargs="*", metavar="COLUMN=VALUE")
+
+    command = commands.add_parser("update", help="change columns of a row")
+    command.add_argument("table")
+    command.add_argument("id", type=int)
+    command.add_argument("values", nargs="+", metavar="COLUMN=VALUE")
+
+    command = commands.add_parser("delete", help="delete rows by ID")
+    command.add_argument("table")
+    command.add_argument("ids", nargs="+", type=int, metavar="ID")
+
+    command = commands.add_parser("cast", help="print the cast lists of shows")
+    command.add_argument("showIds", nargs="+", type=int, metavar="SHOW_ID")
+    command.add_argument("--format", choices=ROW_FORMATS, default="jsonl", help="output format")
+
+    command = commands.add_parser("import", help="bulk load CSV or JSONL files (- for JSON lines on stdin)")
+    command.add_argument("table")
+    command.add_argument("files", nargs="+", metavar="FILE")
+    command.add_argument("--batch-size", type=int, default=50000, help="rows per transaction")
+
+    command = commands.add_parser("export", help="export tables or cast lists to files")
+    command.add_argument("names", nargs="*", metavar="NAME", help="tables to export, or cast_lists (default: all)")
+    command.add_argument("--format", choices=["csv", "jsonl", "columnar", "parquet"], default="csv", help="file format")
+    command.add_argument("--output-dir", default="exports", help="directory to write the files to")
+    command.add_argument("--gzip", action="store_true", help="gzip CSV and JSONL files")
+    command.add_argument("--workers", type=int, default=1, help="processes to read each table with")
+
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    # The database module picks its file and profile when it's imported
+    if args.db:
+        os.environ["LB_DB_PATH"] = args.db
+    if args.profile:
+        os.environ["LB_DB_PROFILE"] = args.profile
+    import database
+
+    try:
+        COMMANDS[args.command](database, args)
+    except (ValueError, RuntimeError, sqlite3.Error) as error:
+        sys.stderr.write(json.dumps({"error": str(error)}) + "\n")
+        sys.exit(1)
+    except BrokenPipeError:
+        # The reader stopped early, e.g. piped into head. Point stdout at
+        # devnull so flushing it on exit doesn't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
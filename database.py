@@ -1,103 +1,1499 @@
+import difflib
+import logging
+import os
+import re
 import sqlite3
-from tabulate import tabulate
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import islice
+from datetime import date
+from pathlib import Path
+
+import output
+import profiling
+
+# Named connection settings for different workloads. Every profile uses WAL
+# so readers can keep working while something is being written, and so
+# switching profiles never needs exclusive access to the file.
+PROFILES = {
+    # Day to day use through the menu
+    "interactive": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # Negative sizes are in KiB
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "OFF",
+    },
+    # Loading lots of data at once. A crash can lose the last commits but
+    # won't corrupt the file.
+    "bulk-load": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "OFF",
+    },
+    # Mostly lookups with the odd write
+    "read-mostly": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "OFF",
+    },
+}
+
+# Profile to use when none is given. Can be set with the LB_DB_PROFILE
+# environment variable.
+DEFAULT_PROFILE = os.environ.get("LB_DB_PROFILE", "interactive")
+
+# Database file to use. Can be set with the LB_DB_PATH environment variable.
+DB_PATH = os.environ.get("LB_DB_PATH", "legally-blonde.db")
+
+
+def apply_profile(connection, profile):
+    """
+    Apply the settings of a named profile to an open connection.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile}. Choose from: {', '.join(PROFILES)}")
 
-# Connect the database (or create it if it doesn't exist)
-connection = sqlite3.connect("legally-blonde.db")
+    for pragma, value in PROFILES[profile].items():
+        connection.execute(f"PRAGMA {pragma} = {value}")
 
-# Create the cursor
-cursor = connection.cursor()
 
-# Create tables if they don't already exist
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            characters (
-            charId INTEGER PRIMARY KEY AUTOINCREMENT,
-            fName TEXT,
-            lName TEXT,
-            title TEXT,
-            suffix TEXT
-            )""")
+def connect(path=DB_PATH, profile=DEFAULT_PROFILE, read_only=False):
+    """
+    Open a connection to the database with the settings of a profile.
+    Read-only connections can be shared between threads.
+    """
+    if read_only:
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                     factory=profiling.connection_factory())
+    else:
+        connection = sqlite3.connect(path, factory=profiling.connection_factory())
+    apply_profile(connection, profile)
+    # IDs of show times and cover types by lowercase name, so each one is
+    # only looked up once. Kept with the connection, since another file can
+    # have other IDs.
+    connection.lookup_ids = {}
+    return connection
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            alias (
-            aliasId INTEGER PRIMARY KEY AUTOINCREMENT,
-            alias TEXT
-            )""")
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            char_has_alias (
-            charAliasId INTEGER PRIMARY KEY AUTOINCREMENT,
-            charId INTEGER,
-            aliasId INTEGER,
-            FOREIGN KEY (charId) REFERENCES characters(charId),
-            FOREIGN KEY (aliasId) REFERENCES alias(aliasId)
-            )""")
+# Version of the table layout, kept in the file's user_version. Version 2
+# stores show dates as days since 1970-01-01, and show times and cover
+# types as IDs in the show_times and cover_types tables.
+SCHEMA_VERSION = 2
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            actors (
-            actorId INTEGER PRIMARY KEY AUTOINCREMENT,
-            fName TEXT NOT NULL,
-            lName TEXT NOT NULL
-            )""")
+# Show dates are stored as days since this date
+EPOCH = date(1970, 1, 1)
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            actor_is_char (
-            acId INTEGER PRIMARY KEY AUTOINCREMENT,
-            actorId INTEGER,
-            charId INTEGER,
-            FOREIGN KEY (actorId) REFERENCES actors(actorId),
-            FOREIGN KEY (charId) REFERENCES characters(charId)
-            )""")
+# SQLite's julianday() of EPOCH. date(days + EPOCH_JULIAN_DAY) turns a
+# stored day back into YYYY-MM-DD.
+EPOCH_JULIAN_DAY = 2440587.5
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS
-            productions (
-            prodId INTEGER PRIMARY KEY AUTOINCREMENT,
-            prodName TEXT NOT NULL,
-            prodStartYr INT NOT NULL,
-            prodEndYr INT
-            )""")
+# Times a show can be at, as (timeId, code, name)
+SHOW_TIMES = [(1, "M", "matinee"), (2, "E", "evening")]
+
+# Cover types every database starts with. Others are added as they're used.
+COVER_TYPES = ["actor", "understudy", "swing", "standby", "emergency cover"]
 
-cursor.execute("""
+# The tables that changed in version 2, created under a given name so they
+# can be rebuilt when upgrading older files
+SHOWS_TABLE = """
         CREATE TABLE IF NOT EXISTS
-            shows (
+            {name} (
             showId INTEGER PRIMARY KEY AUTOINCREMENT,
             prodId INTEGER,
-            date DATE,
-            time TEXT,
+            date INTEGER,
+            time INTEGER,
             location TEXT,
-            FOREIGN KEY (prodId) REFERENCES productions(prodId)
-            )""")
+            FOREIGN KEY (prodId) REFERENCES productions(prodId),
+            FOREIGN KEY (time) REFERENCES show_times(timeId)
+            )"""
 
-cursor.execute("""
+CAST_LIST_TABLE = """
         CREATE TABLE IF NOT EXISTS
-            cast_list (
+            {name} (
             castListId INTEGER PRIMARY KEY AUTOINCREMENT,
             showId INTEGER,
             acId INTEGER,
-            type TEXT,
+            type INTEGER,
             FOREIGN KEY (showId) REFERENCES shows(showId),
-            FOREIGN KEY (acId) REFERENCES actor_is_char(acId)
+            FOREIGN KEY (acId) REFERENCES actor_is_char(acId),
+            FOREIGN KEY (type) REFERENCES cover_types(typeId)
+            )"""
+
+
+def sql_date(days):
+    """
+    SQL turning a column (or expression) of stored days back into YYYY-MM-DD.
+    """
+    return f"date({days} + {EPOCH_JULIAN_DAY})"
+
+
+def migrate_to_v2(cursor):
+    """
+    Rebuild the shows and cast_list tables of a version 1 file, turning date
+    text into days and time and type text into IDs. Values that can't be
+    read are left empty and counted.
+    """
+    cursor.execute("""
+        INSERT OR IGNORE INTO cover_types (type)
+        SELECT DISTINCT lower(trim(type)) FROM cast_list WHERE trim(type) != ''
+        """)
+
+    cursor.execute(SHOWS_TABLE.format(name="shows_v2"))
+    cursor.execute(f"""
+        INSERT INTO shows_v2 (showId, prodId, date, time, location)
+        SELECT showId, prodId, CAST(julianday(date(trim(date))) - {EPOCH_JULIAN_DAY} AS INTEGER),
+        (SELECT timeId FROM show_times WHERE code = upper(trim(shows.time))), location
+        FROM shows
+        """)
+    cursor.execute("""
+        SELECT COUNT(*) FROM shows old INNER JOIN shows_v2 new ON old.showId = new.showId
+        WHERE (old.date IS NOT NULL AND new.date IS NULL) OR (old.time IS NOT NULL AND new.time IS NULL)
+        """)
+    unreadable = cursor.fetchone()[0]
+
+    cursor.execute(CAST_LIST_TABLE.format(name="cast_list_v2"))
+    cursor.execute("""
+        INSERT INTO cast_list_v2 (castListId, showId, acId, type)
+        SELECT castListId, showId, acId, (SELECT typeId FROM cover_types WHERE type = lower(trim(cast_list.type)))
+        FROM cast_list
+        """)
+
+    # Triggers on the old tables go with them. The summary tables and the
+    # cast view triggers counted types by name, so they go too.
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND (name LIKE 'cast_view_%' OR name LIKE 'summary_%')")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary_covers'")
+    if cursor.fetchone() is not None:
+        cursor.execute("DROP TABLE IF EXISTS summary_appearances")
+        cursor.execute("DROP TABLE summary_covers")
+        print("The summary tables were removed. Turn them back on with: python reports.py --summaries on")
+
+    cursor.execute("DROP TABLE shows")
+    cursor.execute("ALTER TABLE shows_v2 RENAME TO shows")
+    cursor.execute("DROP TABLE cast_list")
+    cursor.execute("ALTER TABLE cast_list_v2 RENAME TO cast_list")
+
+    if unreadable:
+        print(f"{unreadable} shows had a date or time that couldn't be read. They've been left empty.")
+
+
+# Name columns indexed for full text search, with the primary key first
+SEARCH_TABLES = {
+    "characters": ["charId", "fName", "lName", "title", "suffix"],
+    "alias": ["aliasId", "alias"],
+    "actors": ["actorId", "fName", "lName"],
+}
+
+
+def create_search_index(cursor, table, columns):
+    """
+    Create the full text search index for a table and the triggers that keep
+    it in sync. The index only stores the words, the names themselves are
+    read from the table.
+    """
+    key = columns[0]
+    fields = ", ".join(columns[1:])
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", [f"{table}_search"])
+    exists = cursor.fetchone() is not None
+
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5(
+            {fields}, content={table}, content_rowid={key},
+            tokenize="unicode61 remove_diacritics 2", prefix="1 2 3"
             )""")
+    # List of every word in the index, for suggesting spellings
+    cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search_words USING fts5vocab({table}_search, row)")
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_search (rowid, {fields}) VALUES ({new_values});
+        END""")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_search ({table}_search, rowid, {fields}) VALUES ('delete', {old_values});
+        END""")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {table}_search ({table}_search, rowid, {fields}) VALUES ('delete', {old_values});
+            INSERT INTO {table}_search (rowid, {fields}) VALUES ({new_values});
+        END""")
+
+    # Index the names already in older database files
+    if not exists:
+        cursor.execute(f"INSERT INTO {table}_search ({table}_search) VALUES ('rebuild')")
+
+
+def initialize_schema(connection):
+    """
+    Create the tables and indexes of a new database file, or bring an older
+    one up to date. Files already at SCHEMA_VERSION are left alone, so this
+    is a single PRAGMA once the file is current.
+    Returns whether an older file was upgraded.
+    """
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA user_version")
+    schema_version = cursor.fetchone()[0]
+    if schema_version >= SCHEMA_VERSION:
+        cursor.close()
+        return False
+
+    # Files made before the schema was versioned have tables but no version
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shows'")
+    upgrading = cursor.fetchone() is not None
+
+    # Create tables if they don't already exist
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                characters (
+                charId INTEGER PRIMARY KEY AUTOINCREMENT,
+                fName TEXT,
+                lName TEXT,
+                title TEXT,
+                suffix TEXT
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                alias (
+                aliasId INTEGER PRIMARY KEY AUTOINCREMENT,
+                alias TEXT
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                char_has_alias (
+                charAliasId INTEGER PRIMARY KEY AUTOINCREMENT,
+                charId INTEGER,
+                aliasId INTEGER,
+                FOREIGN KEY (charId) REFERENCES characters(charId),
+                FOREIGN KEY (aliasId) REFERENCES alias(aliasId)
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                actors (
+                actorId INTEGER PRIMARY KEY AUTOINCREMENT,
+                fName TEXT NOT NULL,
+                lName TEXT NOT NULL
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                actor_is_char (
+                acId INTEGER PRIMARY KEY AUTOINCREMENT,
+                actorId INTEGER,
+                charId INTEGER,
+                FOREIGN KEY (actorId) REFERENCES actors(actorId),
+                FOREIGN KEY (charId) REFERENCES characters(charId)
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                productions (
+                prodId INTEGER PRIMARY KEY AUTOINCREMENT,
+                prodName TEXT NOT NULL,
+                prodStartYr INT NOT NULL,
+                prodEndYr INT
+                )""")
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                show_times (
+                timeId INTEGER PRIMARY KEY,
+                code TEXT NOT NULL UNIQUE,
+                name TEXT
+                )""")
+    cursor.executemany("INSERT OR IGNORE INTO show_times (timeId, code, name) VALUES (?, ?, ?)", SHOW_TIMES)
+
+    cursor.execute("""
+            CREATE TABLE IF NOT EXISTS
+                cover_types (
+                typeId INTEGER PRIMARY KEY,
+                type TEXT NOT NULL UNIQUE
+                )""")
+    cursor.executemany("INSERT OR IGNORE INTO cover_types (type) VALUES (?)", [(type,) for type in COVER_TYPES])
+
+    cursor.execute(SHOWS_TABLE.format(name="shows"))
+    cursor.execute(CAST_LIST_TABLE.format(name="cast_list"))
+
+    # Bring older files up to date before indexing the new tables
+    if upgrading:
+        migrate_to_v2(cursor)
+
+    # Index the foreign key columns so joins and lookups don't scan whole tables.
+    # IF NOT EXISTS also adds them to database files created before they existed.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_char_has_alias_charId ON char_has_alias (charId)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_char_has_alias_aliasId ON char_has_alias (aliasId)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_actor_is_char_actorId ON actor_is_char (actorId)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_actor_is_char_charId ON actor_is_char (charId)")
+    # Also covers lookups on prodId alone, and lets reports on a production's
+    # run read just the index
+    cursor.execute("DROP INDEX IF EXISTS idx_shows_prodId")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_shows_prodId_date_time ON shows (prodId, date, time)")
+    # Lets reports on dates and locations read just the index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_shows_date_location ON shows (date, location)")
+    # Also covers lookups on showId alone
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cast_list_showId_acId ON cast_list (showId, acId)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cast_list_acId ON cast_list (acId)")
+    # Lets reports on covers read just the index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cast_list_type_showId ON cast_list (type, showId)")
+
+    for table, columns in SEARCH_TABLES.items():
+        create_search_index(cursor, table, columns)
+
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    connection.commit()
+    cursor.close()
+    return upgrading
+
+
+def initialize(path=DB_PATH):
+    """
+    Create or upgrade the tables of a database file, for programs that only
+    open read-only connections to it.
+    """
+    initializing = connect(path)
+    try:
+        initialize_schema(initializing)
+    finally:
+        initializing.close()
+
+
+# The connection and cursor used by the menu and by default everywhere
+# else. Nothing is opened until get_connection() or get_cursor() is first
+# called, so importing this module is cheap.
+connection = None
+cursor = None
+
+# Read cast lists from show_cast_view when the database has it. Checked
+# when the connection is opened.
+use_cast_view = False
+
+
+def get_connection():
+    """
+    Get the shared connection, opening the database and creating or
+    upgrading its tables the first time.
+    """
+    global connection, cursor, use_cast_view
+
+    if connection is None:
+        opened = connect()
+        upgraded = initialize_schema(opened)
+        connection = opened
+        cursor = connection.cursor()
+        use_cast_view = cast_view_enabled(connection)
+        # Upgrading the schema drops the cast view's triggers, so build it again
+        if use_cast_view and upgraded:
+            enable_cast_view()
+    return connection
+
+
+def get_cursor():
+    """
+    Get the shared cursor, opening the database if it isn't open yet.
+    """
+    get_connection()
+    return cursor
+
+
+# Number of rows to fetch and render at a time when viewing a table
+PAGE_SIZE = 100
+
+# Columns of each table, in order, with the primary key first
+COLUMNS = {
+    "characters": ["charId", "fName", "lName", "title", "suffix"],
+    "alias": ["aliasId", "alias"],
+    "char_has_alias": ["charAliasId", "charId", "aliasId"],
+    "actors": ["actorId", "fName", "lName"],
+    "actor_is_char": ["acId", "actorId", "charId"],
+    "productions": ["prodId", "prodName", "prodStartYr", "prodEndYr"],
+    "shows": ["showId", "prodId", "date", "time", "location"],
+    "cast_list": ["castListId", "showId", "acId", "type"],
+    "show_times": ["timeId", "code", "name"],
+    "cover_types": ["typeId", "type"],
+}
+
+# Columns holding whole numbers
+INTEGER_COLUMNS = {column for columns in COLUMNS.values() for column in columns if column.endswith("Id")}
+INTEGER_COLUMNS.update(["prodStartYr", "prodEndYr"])
+
+
+def to_integer(value):
+    """
+    Turn typed text into a whole number. Empty text is stored as NULL.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return int(value) if isinstance(value, int) else int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{value!r} isn't a whole number.")
+
+
+def to_days(value, exported=False):
+    """
+    Turn a YYYY-MM-DD date into the number of days since 1970-01-01.
+    Numbers are taken to be days already, and so is text of only digits if
+    it was exported (CSV exports have dates as days).
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if exported and text.lstrip("-").isdigit():
+        return int(text)
+    try:
+        return (date.fromisoformat(text) - EPOCH).days
+    except ValueError:
+        raise ValueError(f"{value!r} isn't a date. Use YYYY-MM-DD.")
+
+
+def lookup_id(table, value, connection=None, add=True):
+    """
+    Get the ID of a show time (M, E, matinee or evening) or a cover type.
+    Cover types that aren't in the cover_types table yet are added to it,
+    unless add is False. Numbers are taken to be IDs already.
+    """
+    if connection is None:
+        connection = get_connection()
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    name = str(value).strip().lower()
+    if name.isdigit():
+        return int(name)
+    # Connections not opened with connect() don't remember IDs
+    lookup_ids = getattr(connection, "lookup_ids", {})
+    if (table, name) in lookup_ids:
+        return lookup_ids[table, name]
+
+    if table == "show_times":
+        row = connection.execute("SELECT timeId FROM show_times WHERE lower(code) = ? OR lower(name) = ?",
+                                 [name, name]).fetchone()
+        if row is None:
+            raise ValueError(f"{value!r} isn't a show time. Use M for matinee or E for evening.")
+    else:
+        row = connection.execute("SELECT typeId FROM cover_types WHERE type = ?", [name]).fetchone()
+        if row is None:
+            if not add:
+                raise ValueError(f"{value!r} isn't a cover type.")
+            # Not remembered, since the new row goes if the write is rolled back
+            return connection.execute("INSERT INTO cover_types (type) VALUES (?)", [name]).lastrowid
+
+    lookup_ids[table, name] = row[0]
+    return row[0]
+
+
+def coerce_value(table, column, value, connection=None, exported=False):
+    """
+    Convert a value as it's typed or read from a file into what's stored in
+    a column. Raises ValueError if it can't be. exported is set for values
+    read back from an export, which are stored values already.
+    """
+    if table == "shows" and column == "date":
+        return to_days(value, exported)
+    elif table == "shows" and column == "time":
+        return lookup_id("show_times", value, connection)
+    elif table == "cast_list" and column == "type":
+        return lookup_id("cover_types", value, connection)
+    elif column in INTEGER_COLUMNS:
+        return to_integer(value)
+    return value
+
+
+def coerce_row(table, columns, values, connection=None, exported=False):
+    """
+    Convert a list of values for the given columns of a table.
+    """
+    return [coerce_value(table, column, value, connection, exported) for column, value in zip(columns, values)]
+
+
+def render(records, headers):
+    """
+    Print records as a table in the chosen output format.
+    """
+    table = output.open_table(headers, widths=DISPLAY_WIDTHS)
+    if records:
+        table.write(records)
+    table.close()
 
 
 def get_qmarks(values):
     return ", ".join("?" for _ in values)
 
 
+# How to show the columns that aren't stored the way they're typed
+DISPLAY_COLUMNS = {
+    ("shows", "date"): sql_date("shows.date"),
+    ("shows", "time"): "(SELECT code FROM show_times WHERE timeId = shows.time)",
+    ("cast_list", "type"): "(SELECT type FROM cover_types WHERE typeId = cast_list.type)",
+}
+
+# Tables the IDs in lookup columns come from
+LOOKUP_TABLES = {
+    ("shows", "time"): "show_times",
+    ("cast_list", "type"): "cover_types",
+}
+
+
+def shown_columns(table, columns):
+    """
+    SELECT expressions for columns of a table as they're shown, with dates
+    as YYYY-MM-DD and times and cover types by name.
+    """
+    return [f"{DISPLAY_COLUMNS[table, column]} AS {column}" if (table, column) in DISPLAY_COLUMNS else column
+            for column in columns]
+
+
+def build_statements(table):
+    """
+    Build the parameterized statements for each operation on a table.
+    """
+    columns = COLUMNS[table]
+    key = columns[0]
+    fields = columns[1:]
+
+    return {
+        "insert": f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({get_qmarks(columns)})",
+        "select": f"SELECT {', '.join(fields)} FROM {table} WHERE {key} = ?",
+        "update": f"UPDATE {table} SET {', '.join(f'{field} = ?' for field in fields)} WHERE {key} = ?",
+        "delete": f"DELETE FROM {table} WHERE {key} = ?",
+        # Pages are read to be shown, so dates, times and types are decoded
+        "page": f"SELECT {', '.join(shown_columns(table, columns))} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?",
+    }
+
+
+# One statement per table and operation with every value bound as a
+# parameter. The SQL text never changes, so sqlite3 reuses the prepared
+# statement from its cache instead of parsing it again on every call.
+STATEMENTS = {table: build_statements(table) for table in COLUMNS}
+
+# Least widths of some columns in fixed-width tables, so that pages after
+# the first still line up when they have longer names
+DISPLAY_WIDTHS = {
+    "date": 10,
+    "fName": 12,
+    "lName": 14,
+    "actorName": 24,
+    "charName": 24,
+    "prodName": 24,
+    "location": 16,
+}
+
+# Comparisons that can be used to filter rows
+FILTER_OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+
+def sort_expression(table, column):
+    """
+    What a column sorts by: times and cover types by name, and anything
+    else by what's stored, so dates can be sorted by their index.
+    """
+    if (table, column) in LOOKUP_TABLES:
+        return DISPLAY_COLUMNS[table, column]
+    return f"{table}.{column}"
+
+
+def after_condition(sort, values):
+    """
+    A condition picking the rows that sort after a row, given the sort as
+    (expression, descending) pairs and the row's values of them. Returns
+    the SQL and its parameters. NULLs sort first, or last when descending.
+    """
+    expressions = [expression for expression, _ in sort]
+    directions = {descending for _, descending in sort}
+    if len(directions) == 1 and None not in values:
+        # A row value comparison can start from the right place in an index
+        operator = "<" if directions == {True} else ">"
+        return f"({', '.join(expressions)}) {operator} ({get_qmarks(values)})", list(values)
+
+    alternatives = []
+    params = []
+    for index, ((expression, descending), value) in enumerate(zip(sort, values)):
+        if value is None and descending:
+            # Nothing sorts after NULL
+            continue
+        if value is None:
+            later, later_params = f"{expression} IS NOT NULL", []
+        elif descending:
+            later, later_params = f"({expression} < ? OR {expression} IS NULL)", [value]
+        else:
+            later, later_params = f"{expression} > ?", [value]
+        same = [f"{earlier} IS ?" for earlier in expressions[:index]]
+        alternatives.append("(" + " AND ".join(same + [later]) + ")")
+        params.extend(list(values[:index]) + later_params)
+    return "(" + (" OR ".join(alternatives) or "0") + ")", params
+
+
+def build_select(table, columns=None, order_by=None, filters=None, limit=None, after=None):
+    """
+    Build a SELECT on a table from a list of columns, a list of columns to
+    sort by (starting with - to sort descending) and a list of
+    (column, operator, value) filters. Column names are checked against the
+    table and every value is bound as a parameter.
+
+    To page through the rows, pass after: [] for the first page, then the
+    values the last row read ended with. The values of the sort columns are
+    added to the end of each row for this.
+    Returns the SQL and its parameters.
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    key = COLUMNS[table][0]
+
+    def check(column):
+        if column not in COLUMNS[table]:
+            raise ValueError(f"The {table} table has no {column} column.")
+        return column
+
+    columns = [check(column) for column in columns] if columns else COLUMNS[table]
+
+    # Finish with the ID so rows that tie always come out in the same order
+    sort = []
+    for column in order_by or []:
+        descending = column.startswith("-")
+        sort.append((sort_expression(table, check(column.lstrip("-"))), descending))
+    if key not in [column.lstrip("-") for column in order_by or []]:
+        sort.append((f"{table}.{key}", False))
+
+    shown = shown_columns(table, columns)
+    if after is not None:
+        shown += [expression for expression, _ in sort]
+    sql = f"SELECT {', '.join(shown)} FROM {table}"
+    params = []
+
+    conditions = []
+    if filters:
+        for column, operator, value in filters:
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Can't filter with {operator}. Use one of: {' '.join(FILTER_OPERATORS)}")
+            check(column)
+            if (table, column) == ("shows", "date"):
+                # Compare stored days so the date index can be used
+                conditions.append(f"{table}.{column} {operator} ?")
+                params.append(to_days(value))
+            elif (table, column) in LOOKUP_TABLES and operator in ("=", "!="):
+                # Compare stored IDs so the index on the column can be used.
+                # Names only sort by name, so other operators compare names.
+                conditions.append(f"{table}.{column} {operator} ?")
+                params.append(lookup_id(LOOKUP_TABLES[table, column], value, add=False))
+            else:
+                conditions.append(f"{DISPLAY_COLUMNS.get((table, column), column)} {operator} ?")
+                params.append(value)
+    if after:
+        condition, after_params = after_condition(sort, after)
+        conditions.append(condition)
+        params.extend(after_params)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f"{expression} DESC" if descending else expression for expression, descending in sort)
+
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    return sql, params
+
+
+def parse_filters(text):
+    """
+    Turn text like "date >= 2008-01-01 and location = New York" into a
+    list of (column, operator, value) filters.
+    """
+    filters = []
+    for part in re.split(r"\s+and\s+", text.strip(), flags=re.IGNORECASE):
+        if not part:
+            continue
+        match = re.fullmatch(r"\s*(\w+)\s*(!=|<=|>=|=|<|>)\s*(.*?)\s*", part)
+        if match is None:
+            raise ValueError(f"Couldn't understand the filter {part!r}. Use something like: location = New York")
+        filters.append(match.groups())
+    return filters
+
+
+# Cast list for a single show
+CAST_LIST_QUERY = """
+                SELECT c.fname || ' ' || c.lname, a.fname || ' ' || a.lname, ct.type
+                FROM cast_list cl
+                INNER JOIN actor_is_char ac
+                ON cl.acId = ac.acId
+                INNER JOIN characters c
+                ON ac.charId = c.charId
+                INNER JOIN actors a
+                ON ac.actorId = a.actorId
+                LEFT JOIN cover_types ct
+                ON cl.type = ct.typeId
+                WHERE cl.showId = ?
+                ORDER BY cl.castListId
+                """
+
+# A show's cast listings without any names, for the name directory to fill in
+CAST_ROLES_QUERY = "SELECT acId, type FROM cast_list WHERE showId = ? ORDER BY castListId"
+
+# Cast list for a single show, from the precomputed show_cast_view table
+CAST_VIEW_QUERY = "SELECT charName, actorName, type FROM show_cast_view WHERE showId = ? ORDER BY castListId"
+
+# Rows of show_cast_view, worked out from the cast list and the names
+CAST_VIEW_ROWS = """
+                SELECT cl.showId, cl.castListId, c.fname || ' ' || c.lname, a.fname || ' ' || a.lname, ct.type
+                FROM cast_list cl
+                INNER JOIN actor_is_char ac
+                ON cl.acId = ac.acId
+                INNER JOIN characters c
+                ON ac.charId = c.charId
+                INNER JOIN actors a
+                ON ac.actorId = a.actorId
+                LEFT JOIN cover_types ct
+                ON cl.type = ct.typeId
+                WHERE cl.showId IS NOT NULL
+                """
+
+
+def refresh_cast_view(acIds):
+    """
+    Build the trigger statements that recompute the show_cast_view rows for
+    the cast listings of the given actor/character IDs (an SQL expression).
+    """
+    return f"""
+            DELETE FROM show_cast_view WHERE (showId, castListId) IN (
+                SELECT showId, castListId FROM cast_list WHERE acId IN ({acIds})
+            );
+            INSERT INTO show_cast_view {CAST_VIEW_ROWS} AND cl.acId IN ({acIds});
+            """
+
+
+# Triggers that keep show_cast_view up to date, by name
+CAST_VIEW_TRIGGERS = {
+    "cast_view_cast_list_insert": f"""
+            AFTER INSERT ON cast_list BEGIN
+                INSERT INTO show_cast_view {CAST_VIEW_ROWS} AND cl.castListId = new.castListId;
+            END""",
+    "cast_view_cast_list_update": f"""
+            AFTER UPDATE ON cast_list BEGIN
+                DELETE FROM show_cast_view WHERE showId = old.showId AND castListId = old.castListId;
+                INSERT INTO show_cast_view {CAST_VIEW_ROWS} AND cl.castListId = new.castListId;
+            END""",
+    "cast_view_cast_list_delete": """
+            AFTER DELETE ON cast_list BEGIN
+                DELETE FROM show_cast_view WHERE showId = old.showId AND castListId = old.castListId;
+            END""",
+    "cast_view_actor_is_char_insert": f"""
+            AFTER INSERT ON actor_is_char BEGIN {refresh_cast_view("new.acId")} END""",
+    "cast_view_actor_is_char_update": f"""
+            AFTER UPDATE ON actor_is_char BEGIN {refresh_cast_view("old.acId, new.acId")} END""",
+    "cast_view_actor_is_char_delete": f"""
+            AFTER DELETE ON actor_is_char BEGIN {refresh_cast_view("old.acId")} END""",
+}
+for table, key in [("characters", "charId"), ("actors", "actorId")]:
+    CAST_VIEW_TRIGGERS[f"cast_view_{table}_insert"] = f"""
+            AFTER INSERT ON {table} BEGIN
+                {refresh_cast_view(f"SELECT acId FROM actor_is_char WHERE {key} = new.{key}")}
+            END"""
+    CAST_VIEW_TRIGGERS[f"cast_view_{table}_update"] = f"""
+            AFTER UPDATE ON {table} BEGIN
+                {refresh_cast_view(f"SELECT acId FROM actor_is_char WHERE {key} IN (old.{key}, new.{key})")}
+            END"""
+    CAST_VIEW_TRIGGERS[f"cast_view_{table}_delete"] = f"""
+            AFTER DELETE ON {table} BEGIN
+                {refresh_cast_view(f"SELECT acId FROM actor_is_char WHERE {key} = old.{key}")}
+            END"""
+
+
+def cast_view_enabled(connection=None):
+    """
+    Check whether the database has the show_cast_view table.
+    """
+    if connection is None:
+        connection = get_connection()
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'show_cast_view'").fetchone()
+    return row is not None
+
+
+def enable_cast_view():
+    """
+    Create and fill the show_cast_view table, which holds every show's cast
+    list with the names already put together, and the triggers that keep
+    it up to date as the other tables change.
+    """
+    global use_cast_view
+
+    connection = get_connection()
+    cursor = get_cursor()
+
+    # Stored in show order so a show's cast list is one range of the table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS
+            show_cast_view (
+            showId INTEGER NOT NULL,
+            castListId INTEGER NOT NULL,
+            charName TEXT,
+            actorName TEXT,
+            type TEXT,
+            PRIMARY KEY (showId, castListId)
+            ) WITHOUT ROWID""")
+    cursor.execute("DELETE FROM show_cast_view")
+    cursor.execute(f"INSERT INTO show_cast_view {CAST_VIEW_ROWS}")
+    for name, trigger in CAST_VIEW_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}")
+    connection.commit()
+
+    use_cast_view = True
+    cast_cache.clear()
+
+
+def disable_cast_view():
+    """
+    Remove the show_cast_view table and its triggers.
+    """
+    global use_cast_view
+
+    connection = get_connection()
+    cursor = get_cursor()
+
+    for name in CAST_VIEW_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cursor.execute("DROP TABLE IF EXISTS show_cast_view")
+    connection.commit()
+
+    use_cast_view = False
+    cast_cache.clear()
+
+
+# Every row added, changed or deleted, in order, once turned on with
+# enable_change_log(). Rows with a NULL table mark where logging started
+# again, since changes from before then may be missing.
+CHANGE_LOG_TABLE = """
+        CREATE TABLE IF NOT EXISTS
+            change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tableName TEXT,
+            rowId INTEGER,
+            operation TEXT
+            )"""
+
+# Triggers that fill change_log, by name
+CHANGE_LOG_TRIGGERS = {}
+for table in COLUMNS:
+    CHANGE_LOG_TRIGGERS[f"change_log_{table}_insert"] = f"""
+            AFTER INSERT ON {table} BEGIN
+                INSERT INTO change_log (tableName, rowId, operation) VALUES ('{table}', new.rowid, 'insert');
+            END"""
+    # A row whose ID changes is gone from its old ID
+    CHANGE_LOG_TRIGGERS[f"change_log_{table}_update"] = f"""
+            AFTER UPDATE ON {table} BEGIN
+                INSERT INTO change_log (tableName, rowId, operation)
+                SELECT '{table}', old.rowid, 'delete' WHERE old.rowid != new.rowid;
+                INSERT INTO change_log (tableName, rowId, operation) VALUES ('{table}', new.rowid, 'update');
+            END"""
+    CHANGE_LOG_TRIGGERS[f"change_log_{table}_delete"] = f"""
+            AFTER DELETE ON {table} BEGIN
+                INSERT INTO change_log (tableName, rowId, operation) VALUES ('{table}', old.rowid, 'delete');
+            END"""
+
+
+def change_log_enabled(connection=None):
+    """
+    Check whether writes are being logged to change_log.
+    """
+    if connection is None:
+        connection = get_connection()
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'change_log_cast_list_insert'").fetchone()
+    return row is not None
+
+
+def enable_change_log(connection=None):
+    """
+    Start logging every write to change_log.
+    """
+    if connection is None:
+        connection = get_connection()
+    if change_log_enabled(connection):
+        return
+    connection.execute(CHANGE_LOG_TABLE)
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_change_log_tableName_seq ON change_log (tableName, seq)")
+    connection.execute("INSERT INTO change_log (tableName, rowId, operation) VALUES (NULL, NULL, 'start')")
+    for name, trigger in CHANGE_LOG_TRIGGERS.items():
+        connection.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}")
+    connection.commit()
+
+
+def disable_change_log(connection=None):
+    """
+    Stop logging writes. The log is kept, so its sequence numbers carry on
+    from where they were if it's turned back on.
+    """
+    if connection is None:
+        connection = get_connection()
+    for name in CHANGE_LOG_TRIGGERS:
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    connection.commit()
+
+
+# Number of shows to keep cast lists in memory for
+CAST_CACHE_SIZE = 512
+
+# Writes to these tables can change what a cast list looks like
+CAST_LIST_TABLES = ("cast_list", "actor_is_char", "characters", "actors")
+
+
+class CastListCache:
+    """
+    Keep the most recently used cast lists in memory, keyed by show ID.
+    """
+
+    def __init__(self, size=CAST_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Moves on whenever lists are dropped, so a list read before that
+        # isn't put back
+        self.generation = 0
+
+    def get(self, showId):
+        with self.lock:
+            if showId in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(showId)
+                return self.entries[showId]
+            self.misses += 1
+            return None
+
+    def put(self, showId, records, generation=None):
+        """
+        Keep a cast list, unless lists have been dropped since the given
+        generation, when it may have been read before the change.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[showId] = records
+            self.entries.move_to_end(showId)
+            # Drop the least recently used shows once we're over the limit
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, showId):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(showId, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.entries),
+            }
+
+
+cast_cache = CastListCache()
+
+
+def get_cast_list(showId):
+    """
+    Get the cast list for a show, from the cache if we've seen it before.
+    """
+    showId = int(showId)
+
+    records = cast_cache.get(showId)
+    if records is None:
+        generation = cast_cache.generation
+        cursor = get_cursor()
+        if use_cast_view:
+            cursor.execute(CAST_VIEW_QUERY, [showId])
+            records = tuple(cursor.fetchall())
+        else:
+            # Only the cast list itself is read, the names come from memory
+            cursor.execute(CAST_ROLES_QUERY, [showId])
+            records = names.cast_list(cursor.fetchall())
+        cast_cache.put(showId, records, generation)
+    return records
+
+
+def forget_cast_lists(table, showIds=()):
+    """
+    Drop any cached cast lists that a write to a table may have changed.
+    """
+    if table == "cast_list":
+        # Only the shows the row belonged to are affected
+        for showId in showIds:
+            try:
+                cast_cache.invalidate(int(showId))
+            except (TypeError, ValueError):
+                pass
+    elif table in CAST_LIST_TABLES:
+        # Actors and characters can be in any number of shows
+        cast_cache.clear()
+
+
+# What the name directory keeps of each table: the ID column, then the
+# other columns as SQL expressions with the array typecode to store them in
+# ("s" for a list of strings). Missing IDs, and legacy IDs that aren't
+# numbers, are stored as 0, which no row has.
+NAME_COLUMNS = {
+    "actors": ("actorId", [("fName || ' ' || lName", "s")]),
+    "characters": ("charId", [("fName || ' ' || lName", "s"),
+                              ("trim(title || ' ' || fName || ' ' || lName || ' ' || suffix)", "s")]),
+    "alias": ("aliasId", [("alias", "s")]),
+    "productions": ("prodId", [("prodName", "s")]),
+    "actor_is_char": ("acId", [("CASE WHEN typeof(actorId) = 'integer' THEN actorId ELSE 0 END", "q"),
+                               ("CASE WHEN typeof(charId) = 'integer' THEN charId ELSE 0 END", "q")]),
+    "cover_types": ("typeId", [("type", "s")]),
+}
+
+# Columns that hold the IDs of rows in the name directory's tables
+NAME_REFERENCES = {
+    "char_has_alias": {"charId": "characters", "aliasId": "alias"},
+    "actor_is_char": {"actorId": "actors", "charId": "characters"},
+    "shows": {"prodId": "productions"},
+    "cast_list": {"acId": "actor_is_char"},
+}
+
+# Headers of the ID listings shown before asking for an ID
+NAME_HEADERS = {
+    "actors": ["ID", "actorName"],
+    "characters": ["ID", "charName"],
+    "alias": ["ID", "alias"],
+    "productions": ["ID", "prodName"],
+    "actor_is_char": ["ID", "actorId", "actorName", "charId", "charName"],
+}
+
+
+class NameTable:
+    """
+    The IDs of a table in order, with the other columns in arrays (or lists
+    of strings) alongside them.
+    """
+
+    __slots__ = ("ids", "columns")
+
+    def __init__(self, typecodes):
+        self.ids = array("q")
+        self.columns = [[] if typecode == "s" else array(typecode) for typecode in typecodes]
+
+    def extend(self, rows):
+        # Rows must come in ID order, after the IDs already here
+        for row in rows:
+            self.ids.append(row[0])
+            for column, value in zip(self.columns, row[1:]):
+                column.append(value)
+
+    def position(self, id):
+        """
+        Where an ID is in the arrays, or -1 if the table doesn't have it.
+        """
+        # IDs are always whole numbers, so text left in old rows names nothing
+        if not isinstance(id, int):
+            return -1
+        index = bisect_left(self.ids, id)
+        if index < len(self.ids) and self.ids[index] == id:
+            return index
+        return -1
+
+    def last_id(self):
+        return self.ids[-1] if self.ids else 0
+
+
+class NameDirectory:
+    """
+    Keep the names of actors, characters, aliases, productions and cover
+    types, and which actor plays which character, in memory, so showing
+    names and checking IDs doesn't need a join.
+
+    Rows added since the last look are read by ID. Tables changed in any
+    other way are read again in full, either when forget() is told about it
+    or when another connection has written to the file.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.stale = set(NAME_COLUMNS)
+        self.changes = None
+        self.lock = threading.Lock()
+        # (charName, actorName) of each acId looked up since the last
+        # refresh, or None when its actor or character is missing
+        self.cast_names = {}
+
+    def forget(self, table):
+        if table in NAME_COLUMNS:
+            with self.lock:
+                self.stale.add(table)
+
+    def load(self, connection, table, after=None):
+        key, columns = NAME_COLUMNS[table]
+        sql = f"SELECT {key}, {', '.join(expression for expression, _ in columns)} FROM {table}"
+        if after is None:
+            self.tables[table] = NameTable([typecode for _, typecode in columns])
+            rows = connection.execute(f"{sql} WHERE {key} IS NOT NULL ORDER BY {key}")
+        else:
+            rows = connection.execute(f"{sql} WHERE {key} > ? ORDER BY {key}", [after])
+        self.tables[table].extend(rows)
+
+    def refresh(self):
+        """
+        Bring the names up to date with the database if anything was written.
+        """
+        connection = get_connection()
+        # total_changes counts this connection's writes and data_version
+        # moves when another connection commits
+        changes = (connection.total_changes, connection.execute("PRAGMA data_version").fetchone()[0])
+        with self.lock:
+            if changes == self.changes and not self.stale:
+                return
+            if self.changes is not None and changes[1] != self.changes[1]:
+                self.stale.update(NAME_COLUMNS)
+            for table in NAME_COLUMNS:
+                if table in self.stale:
+                    self.load(connection, table)
+                else:
+                    self.load(connection, table, self.tables[table].last_id())
+            self.stale.clear()
+            self.changes = changes
+            self.cast_names = {}
+
+    def exists(self, table, id):
+        self.refresh()
+        return self.tables[table].position(id) >= 0
+
+    def listing(self, table):
+        """
+        Every ID of a table with its name, for picking an ID. Actor/character
+        rows have both names.
+        """
+        self.refresh()
+        if table == "actor_is_char":
+            return list(self.roles())
+        # Characters are listed by their full name
+        entries = self.tables[table]
+        return [(id, entries.columns[-1][index]) for index, id in enumerate(entries.ids)]
+
+    def roles(self):
+        """
+        Every actor/character row as (acId, actorId, actorName, charId,
+        charName), leaving out rows whose actor or character is missing.
+        """
+        self.refresh()
+        actors = self.tables["actors"]
+        characters = self.tables["characters"]
+        roles = self.tables["actor_is_char"]
+        actorIds, charIds = roles.columns
+        for index, acId in enumerate(roles.ids):
+            actor = actors.position(actorIds[index])
+            character = characters.position(charIds[index])
+            if actor >= 0 and character >= 0:
+                yield (acId, actorIds[index], actors.columns[0][actor],
+                       charIds[index], characters.columns[1][character])
+
+    def cast_list(self, rows):
+        """
+        Turn (acId, typeId) cast listings into (charName, actorName, type)
+        records, the same as CAST_LIST_QUERY gives.
+        """
+        self.refresh()
+        types = self.tables["cover_types"]
+        records = []
+        for acId, typeId in rows:
+            if acId in self.cast_names:
+                cast_names = self.cast_names[acId]
+            else:
+                cast_names = self.cast_names[acId] = self.role_names(acId)
+            if cast_names is None:
+                continue
+            kind = types.position(typeId) if typeId is not None else -1
+            records.append(cast_names + (types.columns[0][kind] if kind >= 0 else None,))
+        return tuple(records)
+
+    def role_names(self, acId):
+        roles = self.tables["actor_is_char"]
+        role = roles.position(acId) if acId is not None else -1
+        if role < 0:
+            return None
+        actors = self.tables["actors"]
+        characters = self.tables["characters"]
+        actor = actors.position(roles.columns[0][role])
+        character = characters.position(roles.columns[1][role])
+        if actor < 0 or character < 0:
+            return None
+        return (characters.columns[0][character], actors.columns[0][actor])
+
+    def missing(self, table, columns, values):
+        """
+        An error message for the first value that names a row that doesn't
+        exist, or None if they all do.
+        """
+        references = NAME_REFERENCES.get(table, {})
+        for column, value in zip(columns, values):
+            if column in references and value is not None and not self.exists(references[column], value):
+                return f"There is no {column} {value} in the {references[column].upper()} table."
+        return None
+
+
+names = NameDirectory()
+
+
+# Rows written with each executemany call in apply_batch. If any row in a
+# chunk fails, the chunk is redone one row at a time to find which.
+BATCH_CHUNK_SIZE = 5000
+
+
+def apply_batch(table, inserts=(), updates=(), deletes=(), all_or_nothing=False, connection=None):
+    """
+    Add, change and delete many rows of a table in one transaction.
+
+    inserts is a list of dicts of column values, updates is a list of dicts
+    with the primary key and only the columns to change, and deletes is a
+    list of IDs. Rows that fail are skipped and reported, unless
+    all_or_nothing is set, in which case the first failure undoes the
+    whole batch and is raised. Called inside a transaction that's already
+    open, the batch joins it and is committed when the caller commits.
+
+    Returns a dict with the number of rows inserted, updated and deleted,
+    and a list of failures as (operation, index, error message).
+    """
+    if connection is None:
+        connection = get_connection()
+    if table not in COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    key = COLUMNS[table][0]
+    report = {"inserted": 0, "updated": 0, "deleted": 0, "failed": []}
+
+    def group(rows, operation):
+        # One statement for each set of columns, so rows that set the same
+        # columns go through executemany together
+        groups = {}
+        for index, row in enumerate(rows):
+            unknown = set(row) - set(COLUMNS[table])
+            if unknown:
+                raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+            columns = tuple(column for column in COLUMNS[table] if column in row)
+            if operation == "update":
+                if key not in row:
+                    raise ValueError(f"Update {index} has no {key}.")
+                columns = tuple(column for column in columns if column != key) + (key,)
+            try:
+                values = coerce_row(table, columns, [row[column] for column in columns], connection)
+            except ValueError as error:
+                if all_or_nothing:
+                    raise
+                report["failed"].append((operation, index, str(error)))
+                continue
+            groups.setdefault(columns, []).append((index, values))
+        return groups
+
+    counts = {"insert": "inserted", "update": "updated", "delete": "deleted"}
+    batch = connection.cursor()
+
+    # Inside a transaction the caller already has open, the batch is a
+    # savepoint, and committing is left to the caller
+    nested = connection.in_transaction
+    batch.execute("SAVEPOINT batch" if nested else "BEGIN")
+    try:
+        # Grouped inside the transaction, since coercing can add cover types
+        statements = []
+        for columns, rows in group(inserts, "insert").items():
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({get_qmarks(columns)})"
+            statements.append(("insert", sql, rows))
+        for columns, rows in group(updates, "update").items():
+            if len(columns) == 1:
+                # Nothing to change
+                continue
+            sql = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns[:-1])} WHERE {key} = ?"
+            statements.append(("update", sql, rows))
+        if deletes:
+            statements.append(("delete", STATEMENTS[table]["delete"],
+                               [(index, [key_value]) for index, key_value in enumerate(deletes)]))
+
+        for operation, sql, rows in statements:
+            for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+                chunk = rows[start:start + BATCH_CHUNK_SIZE]
+                batch.execute("SAVEPOINT batch_chunk")
+                try:
+                    batch.executemany(sql, [values for _, values in chunk])
+                    report[counts[operation]] += batch.rowcount
+                    batch.execute("RELEASE batch_chunk")
+                    continue
+                except sqlite3.Error:
+                    if all_or_nothing:
+                        raise
+                    batch.execute("ROLLBACK TO batch_chunk")
+                    batch.execute("RELEASE batch_chunk")
+
+                # Redo the chunk a row at a time, keeping the rows that work
+                for index, values in chunk:
+                    batch.execute("SAVEPOINT batch_row")
+                    try:
+                        batch.execute(sql, values)
+                        report[counts[operation]] += batch.rowcount
+                    except sqlite3.Error as error:
+                        batch.execute("ROLLBACK TO batch_row")
+                        report["failed"].append((operation, index, str(error)))
+                    batch.execute("RELEASE batch_row")
+        if nested:
+            batch.execute("RELEASE batch")
+        else:
+            connection.commit()
+    except Exception:
+        if nested:
+            batch.execute("ROLLBACK TO batch")
+            batch.execute("RELEASE batch")
+        else:
+            connection.rollback()
+        raise
+    finally:
+        batch.close()
+
+    if table in CAST_LIST_TABLES:
+        cast_cache.clear()
+    names.forget(table)
+    return report
+
+
+# Most names to show for each table when searching
+SEARCH_LIMIT = 20
+
+
+def search_words(table, words):
+    """
+    Find the IDs in a table whose names start with every one of the words.
+    """
+    cursor = get_cursor()
+
+    # Quote each word so nothing the user types is read as search syntax
+    match = " ".join(f'"{word}"*' for word in words)
+    cursor.execute(f"SELECT rowid FROM {table}_search WHERE {table}_search MATCH ? ORDER BY rank LIMIT ?",
+                   [match, SEARCH_LIMIT])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def suggest_word(table, word):
+    """
+    Find the closest spelling of a word that is in a table's search index.
+    """
+    cursor = get_cursor()
+
+    # Only look through words with the same first letter
+    cursor.execute(f"SELECT term FROM {table}_search_words WHERE term >= ? AND term < ?",
+                   [word[0], chr(ord(word[0]) + 1)])
+    matches = difflib.get_close_matches(word, [row[0] for row in cursor.fetchall()], n=1, cutoff=0.7)
+    return matches[0] if matches else None
+
+
+def search(text, table=None):
+    """
+    Search names in the characters, alias and actors tables. Words match the
+    start of names, and misspelled words fall back to the closest spelling.
+    Aliases also find the characters that have them.
+    Returns a list of (table, ID, name) rows.
+    """
+    cursor = get_cursor()
+
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return []
+
+    tables = [table] if table else list(SEARCH_TABLES)
+    if table == "characters":
+        # Characters can also be found by their aliases
+        tables.append("alias")
+
+    results = []
+    for search_table in tables:
+        ids = search_words(search_table, words)
+        if not ids:
+            # Try again with the closest spelling of each word
+            suggestions = [suggest_word(search_table, word) or word for word in words]
+            if suggestions != words:
+                ids = search_words(search_table, suggestions)
+        if not ids:
+            continue
+
+        qmarks = get_qmarks(ids)
+        if search_table == "characters":
+            cursor.execute(f"""
+                        SELECT 'characters', charId, trim(title || ' ' || fName || ' ' || lName || ' ' || suffix)
+                        FROM characters WHERE charId IN ({qmarks})
+                        """, ids)
+            results.extend(cursor.fetchall())
+        elif search_table == "actors":
+            cursor.execute(f"SELECT 'actors', actorId, fName || ' ' || lName FROM actors WHERE actorId IN ({qmarks})", ids)
+            results.extend(cursor.fetchall())
+        else:
+            if table != "characters":
+                cursor.execute(f"SELECT 'alias', aliasId, alias FROM alias WHERE aliasId IN ({qmarks})", ids)
+                results.extend(cursor.fetchall())
+            if table != "alias":
+                # The characters that go by these aliases
+                cursor.execute(f"""
+                            SELECT 'characters', c.charId,
+                            trim(c.title || ' ' || c.fName || ' ' || c.lName || ' ' || c.suffix) || ' (' || al.alias || ')'
+                            FROM char_has_alias ca
+                            INNER JOIN characters c
+                            ON ca.charId = c.charId
+                            INNER JOIN alias al
+                            ON ca.aliasId = al.aliasId
+                            WHERE ca.aliasId IN ({qmarks})
+                            """, ids)
+                results.extend(cursor.fetchall())
+
+    return results
+
+
+def search_option(table=None):
+    """
+    Ask the user what name to search for and show the matches.
+    """
+    text = input("\nSearch for: ")
+    records = search(text, table)
+    if records:
+        render(records, ["Table", "ID", "Name"])
+    else:
+        print("No matches found.")
+
+
 def view_table_option(table):
     """
     Request if the user would like to view the table to get IDs.
     """
+    if table in SEARCH_TABLES:
+        choice = input(f"\nShow the {table.upper()} table to get IDs (Y/N, or S to search)? ").lower()
+    else:
+        choice = input(f"\nShow the {table.upper()} table to get IDs (Y/N)? ").lower()
 
-    choice = input(f"\nShow the {table.upper()} table to get IDs (Y/N)? ").lower()
-
-    if choice == "y":
+    if choice == "y" and table in NAME_HEADERS:
+        # The IDs and names are already in memory
+        render(names.listing(table), NAME_HEADERS[table])
+    elif choice == "y":
         view_data(table)
+    elif choice == "s" and table in SEARCH_TABLES:
+        search_option(table)
     elif choice == "n":
         return
 
@@ -113,58 +1509,205 @@ def continuous_data(table):
         cont = input("Continue (Y/N)? ").lower()
 
 
-def view_data(table):
+def view_data(table, page_size=PAGE_SIZE, paged=False, columns=None, order_by=None, filters=None, limit=None):
     """
-    Allow user to view the data.
+    Allow user to view the data, one page at a time. Columns, sorting,
+    filters and a limit can be given to only view part of a table.
     """
+    if columns or order_by or filters or limit is not None:
+        view_selection(table, page_size, paged, columns, order_by, filters, limit)
+        return
+
+    cursor = get_cursor()
+
+    # Each table is paged by its primary key so that every page is a quick
+    # index lookup instead of holding the whole table in memory
     if table == "characters":
         # View characters
-        cursor.execute(f"SELECT * FROM {table}")
+        select = f"SELECT * FROM {table}"
+        key = "charId"
         headers = ["ID", "fName", "lName", "Title", "Suffix"]
     elif table == "alias":
         # View alias
-        cursor.execute(f"SELECT * FROM {table}")
+        select = f"SELECT * FROM {table}"
+        key = "aliasId"
         headers = ["ID", "alias"]
     elif table == "char_has_alias":
         # View char/alias
-        cursor.execute(f"SELECT * FROM {table}")
+        select = f"SELECT * FROM {table}"
+        key = "charAliasId"
         headers = ["ID", "charId", "aliasId"]
     elif table == "actors":
         # View actors
-        cursor.execute(f"SELECT * FROM {table}")
+        select = f"SELECT * FROM {table}"
+        key = "actorId"
         headers = ["ID", "fName", "lName"]
     elif table == "actor_is_char":
-        # View actor/char relationship
-        cursor.execute(f"""
-                    SELECT ac.acid, a.actorid, a.fname || ' ' || a.lname, 
-                    c.charid, c.title || ' ' || c.fname || ' ' || c.lname || ' ' || c.suffix
-                    FROM actor_is_char ac
-                    INNER JOIN actors a
-                    ON ac.actorId = a.actorId
-                    INNER JOIN characters c
-                    ON ac.charId = c.charId
-                    """)
-        headers = ["ID", "actorId", "actorName", "charId", "charName"]
+        # View actor/char relationship, with the names from memory rather
+        # than joining actors and characters
+        view_roles(page_size, paged)
+        return
     elif table == "productions":
         # View productions
-        cursor.execute(f"SELECT * FROM {table}")
+        select = f"SELECT * FROM {table}"
+        key = "prodId"
         headers = ["ID", "prodName", "prodStartYr", "prodEndYr"]
     elif table == "shows":
-        # View shows
-        cursor.execute(f"SELECT * FROM {table}")
+        # View shows, with dates and times as they were typed
+        select = f"""
+                    SELECT s.showId, s.prodId, {sql_date("s.date")}, st.code, s.location
+                    FROM shows s
+                    LEFT JOIN show_times st
+                    ON s.time = st.timeId
+                    """
+        key = "s.showId"
         headers = ["ID", "prodId", "date", "time", "location"]
     elif table == "cast_list":
-        # View cast list
-        cursor.execute(f"SELECT * FROM {table}")
+        # View cast list, with cover types by name
+        select = """
+                    SELECT cl.castListId, cl.showId, cl.acId, ct.type
+                    FROM cast_list cl
+                    LEFT JOIN cover_types ct
+                    ON cl.type = ct.typeId
+                    """
+        key = "cl.castListId"
         headers = ["ID", "showId", "acId", "type"]
-    records = cursor.fetchall()
-    print(tabulate(records, headers, tablefmt="grid"))
+    elif table == "show_times":
+        # View show times
+        select = f"SELECT * FROM {table}"
+        key = "timeId"
+        headers = ["ID", "code", "name"]
+    elif table == "cover_types":
+        # View cover types
+        select = f"SELECT * FROM {table}"
+        key = "typeId"
+        headers = ["ID", "type"]
+    else:
+        print("That table does not exist. Check your spelling or add it to the database.")
+        return
+
+    def pages():
+        last_key = None
+        while True:
+            if last_key is None:
+                # First page
+                cursor.execute(f"{select} ORDER BY {key} LIMIT ?", [page_size])
+            else:
+                # Pick up right after the last ID shown
+                cursor.execute(f"{select} WHERE {key} > ? ORDER BY {key} LIMIT ?", [last_key, page_size])
+            records = cursor.fetchmany(page_size)
+            yield records
+            if len(records) < page_size:
+                break
+            # The ID is always the first column
+            last_key = records[-1][0]
+
+    render_pages(pages(), headers, page_size, paged)
+
+
+def render_pages(pages, headers, page_size=PAGE_SIZE, paged=False):
+    """
+    Print pages of records as they're read, as one table. When paged, ask
+    before each page after the first.
+    """
+    table = output.open_table(headers, widths=DISPLAY_WIDTHS)
+    for number, records in enumerate(pages):
+        if number and paged:
+            more = input("Press enter for the next page or Q to stop: ").lower()
+            if more == "q":
+                break
+        if records:
+            table.write(records)
+        if len(records) < page_size:
+            break
+    table.close()
+
+
+def view_roles(page_size=PAGE_SIZE, paged=False):
+    """
+    View every actor/character relationship with both names, one page at a
+    time, straight from the name directory.
+    """
+    roles = names.roles()
+    pages = iter(lambda: list(islice(roles, page_size)), [])
+    render_pages(pages, NAME_HEADERS["actor_is_char"], page_size, paged)
+
+
+def view_selection(table, page_size=PAGE_SIZE, paged=False, columns=None, order_by=None, filters=None, limit=None):
+    """
+    View only the chosen columns and rows of a table, in the chosen order.
+    The database does the sorting and filtering, so only the rows being
+    shown are read.
+    """
+    try:
+        select, params = build_select(table, columns, order_by, filters)
+    except ValueError as error:
+        print(error)
+        return
+    headers = columns or COLUMNS[table]
+    connection = get_connection()
+
+    if not paged:
+        # Nothing waits between pages, so read the one query a page at a
+        # time (a LIMIT of -1 is no limit)
+        selection = connection.execute(f"{select} LIMIT ?", params + [-1 if limit is None else limit])
+        render_pages(iter(lambda: selection.fetchmany(page_size), []), headers, page_size, paged)
+        selection.close()
+        return
+
+    def pages():
+        # Each page is a read of its own, starting after the last row of the
+        # one before, so the database isn't kept locked at the prompt
+        after = []
+        shown = 0
+        while limit is None or shown < limit:
+            size = page_size if limit is None else min(page_size, limit - shown)
+            select, params = build_select(table, columns, order_by, filters, size, after)
+            rows = connection.execute(select, params).fetchall()
+            yield [row[:len(headers)] for row in rows]
+            if len(rows) < size:
+                break
+            shown += size
+            # The sort values come after the columns shown
+            after = rows[-1][len(headers):]
+
+    render_pages(pages(), headers, page_size, paged)
+
+
+def view_options(table):
+    """
+    Ask the user how they'd like to sort and filter a table.
+    """
+    print(f"\nColumns: {', '.join(COLUMNS.get(table, []))}")
+    columns = input("Columns to show, separated by commas (press enter for all): ")
+    order_by = input("Columns to sort by, with - in front to sort descending (press enter for ID): ")
+    filters = input("Filters, e.g. date >= 2008-01-01 and location = New York (press enter for none): ")
+    limit = input("Most rows to show (press enter for all): ")
+
+    try:
+        filters = parse_filters(filters)
+    except ValueError as error:
+        print(error)
+        filters = []
+
+    return {
+        "columns": [column.strip() for column in columns.split(",") if column.strip()],
+        "order_by": [column.strip() for column in order_by.split(",") if column.strip()],
+        "filters": filters,
+        "limit": int(limit) if limit.strip().isdigit() else None,
+    }
 
 
 def add_data(table):
     """
     Allow user to add data to the database.
     """
+    connection = get_connection()
+    cursor = get_cursor()
+
+    # Shows whose cast list changes
+    showIds = []
+
     if table == "characters":
         # Need to know first name, last name, and title
         fName = input("\nEnter the character's first name: ")
@@ -245,14 +1788,32 @@ def add_data(table):
         type = input("What type was their role (actor/understudy/standby/emergency cover, etc)? ")
 
         values = [None, showId, acId, type]
+        showIds = [showId]
     else:
         print("That table does not exist. Check your spelling or add it to the database.")
-    
-    # Get ?s for the length of the tuple
-    qmarks = get_qmarks(values)
+        return
+
+    # Store IDs as numbers, dates as days and times and types as IDs
+    try:
+        values = coerce_row(table, COLUMNS[table], values)
+    except ValueError as error:
+        print(error)
+        return
+    missing = names.missing(table, COLUMNS[table], values)
+    if missing:
+        print(missing)
+        return
+
     # Add the data to the specified table
-    cursor.execute(f"INSERT INTO {table} VALUES ({qmarks})", values)
+    try:
+        cursor.execute(STATEMENTS[table]["insert"], values)
+    except sqlite3.IntegrityError as error:
+        # Refused by a constraint, or by the rules from integrity.py --enforce on
+        connection.rollback()
+        print(error)
+        return
     connection.commit()
+    forget_cast_lists(table, showIds)
     print(f"\nAdded data to the {table.upper()} table.")
 
 
@@ -260,76 +1821,79 @@ def delete_data():
     """
     Allow user to delete data.
     """
+    connection = get_connection()
+    cursor = get_cursor()
+
     # Find out what table they would like to delete from
     table = input("\nWhat table would you like to delete data from? ")
 
     # Display all of the data that the user requests to better know what to update from
     view_data(table)
 
+    # Shows whose cast list changes
+    showIds = []
+
     if table == "characters":
         # Delete from characters
         charId = int(input("\nWhat is the ID of the character you would like to delete? "))
 
         values = [charId,]
-
-        where = f"WHERE charId = {charId}"
     elif table == "alias":
         # Delete from alias
         aliasId = int(input("\nWhat is the ID of the alias you would like to delete? "))
 
         values = [aliasId,]
-
-        where = f"WHERE aliasId = {aliasId}"
     elif table == "char_has_alias":
         # Delete from char_has_alias
         charAliasId = int(input("\nWhat is the ID of the character/alias you would like to delete? "))
 
         values = [charAliasId,]
-
-        where = f"WHERE charAliasId = {charAliasId}"
     elif table == "actors":
         # Delete from actors
         actorId = int(input("\nWhat is the ID of the actor you would like to delete? "))
 
         values = [actorId,]
-
-        where = f"WHERE actorId = {actorId}"
     elif table == "actor_is_char":
         # Delete from actor_is_char
         acId = int(input("\nWhat is the ID of the actor/character relationship you would like to delete? "))
 
         values = [acId,]
-
-        where = f"WHERE acId = {acId}"
     elif table == "productions":
         # Delete from productions
         prodId = int(input("\nWhat is the ID of the production you would like to delete? "))
 
         values = [prodId,]
-
-        where = f"WHERE prodId = {prodId}"
     elif table == "shows":
         # Delete from show
         showId = int(input("\nWhat is the ID of the show you would like to delete? "))
 
         values = [showId,]
-
-        where = f"WHERE showId = {showId}"
     elif table == "cast_list":
         # Delete from show
         castListId = int(input("\nWhat is the ID of the cast listing you would like to delete? "))
 
         values = [castListId,]
 
-        where = f"WHERE castListId = {castListId}"
+        # Find the show the listing belongs to
+        cursor.execute(STATEMENTS[table]["select"], values)
+        currentinfo = cursor.fetchone()
+        if currentinfo is not None:
+            showIds = [currentinfo[0]]
     else:
         print("That table does not exist. Check your spelling or add it to the database.")
-    
-    # Get ?s for the length of the tuple
-    qmarks = get_qmarks(values)
+        return
+
     # Remove data from specified table
-    cursor.execute(f"DELETE FROM {table} {where} = ({qmarks})", values)
+    try:
+        cursor.execute(STATEMENTS[table]["delete"], values)
+    except sqlite3.IntegrityError as error:
+        # Refused by a constraint, or by the rules from integrity.py --enforce on
+        connection.rollback()
+        print(error)
+        return
     connection.commit()
+    forget_cast_lists(table, showIds)
+    names.forget(table)
     print(f"\nRemoved data from the {table.upper()} table.")
 
 
@@ -337,18 +1901,21 @@ def update_data():
     """
     Allow user to update data.
     """
+    connection = get_connection()
+    cursor = get_cursor()
+
     table = input("\nWhat table would you like to update data in? ")
 
     view_data(table)
 
+    # Shows whose cast list changes
+    showIds = []
+
     if table == "characters":
         # Update character
         charId = input("\nWhat is the ID of the character you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE charId = {charId}"
-
-        cursor.execute(f"SELECT fname, lname, title, alias, suffix FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [charId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -370,18 +1937,12 @@ def update_data():
             suffix = currentinfo[3]
 
         # Set the tuple
-        values = [fName, lName, title, suffix]
-
-        # Set the query
-        query = f"SET fName = ?, lName = ?, title = ?, suffix = ?"
+        values = [fName, lName, title, suffix, charId]
     elif table == "alias":
         # Update alias
         aliasId = input("\nWhat is the ID of the alias you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE aliasId = {aliasId}"
-
-        cursor.execute(f"SELECT alias FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [aliasId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -391,18 +1952,12 @@ def update_data():
             alias = currentinfo[0]
 
         # Set the tuple
-        values = [alias,]
-
-        # Set the query
-        query = f"SET alias = ?"
+        values = [alias, aliasId]
     elif table == "char_has_alias":
         # Update char_has_alias
         charAliasId = input("\nWhat is the ID of the alias you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE charAliasId = {charAliasId}"
-
-        cursor.execute(f"SELECT charId, aliasId FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [charAliasId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -419,21 +1974,15 @@ def update_data():
 
         aliasId = input("\nEnter the new alias ID: ")
         if aliasId == "":
-            aliasId = currentinfo[0]
+            aliasId = currentinfo[1]
 
         # Set the tuple
-        values = [charId, aliasId]
-
-        # Set the query
-        query = f"SET charId = ?, aliasId = ?"
+        values = [charId, aliasId, charAliasId]
     elif table == "actors":
         # Update actor
         actorId = input("\nWhat is the ID of the actor you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE actorId = {actorId}"
-
-        cursor.execute(f"SELECT fname, lname FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [actorId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -447,18 +1996,12 @@ def update_data():
             lName = currentinfo[1]
 
         # Set the tuple
-        values = [fName, lName]
-
-        # Set the query
-        query = f"SET fName = ?, lName = ?"
+        values = [fName, lName, actorId]
     elif table == "actor_is_char":
         # Update actor_is_char
         acId = input("\nWhat is the ID of the relationship you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE acId = {acId}"
-
-        cursor.execute(f"SELECT actorId, charId FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [acId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -478,18 +2021,12 @@ def update_data():
             charId = currentinfo[1]
 
         # Set the tuple
-        values = [actorId, charId]
-
-        # Set the query
-        query = f"SET actorId = ?, charId = ?"
+        values = [actorId, charId, acId]
     elif table == "productions":
         # Update productions
         prodId = input("\nWhat is the ID of the production you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE prodId = {prodId}"
-
-        cursor.execute(f"SELECT prodName, prodStartYr, prodEndYr FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [prodId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -507,18 +2044,12 @@ def update_data():
             prodEndYr = currentinfo[2]
 
         # Set the tuple
-        values = [prodName, prodStartYr, prodEndYr]
-
-        # Set the query
-        query = f"SET prodName = ?, prodStartYr = ?, prodEndYr = ?"
+        values = [prodName, prodStartYr, prodEndYr, prodId]
     elif table == "shows":
         # Update show
         showId = input("\nWhat is the ID of the show you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE showId = {showId}"
-
-        cursor.execute(f"SELECT prodId, date, time, location FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [showId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -543,18 +2074,12 @@ def update_data():
             location = currentinfo[3]
 
         # Set the tuple
-        values = [prodId, date, time, location]
-
-        # Set the query
-        query = f"SET prodId = ?, date = ?, time = ?, location = ?"
+        values = [prodId, date, time, location, showId]
     elif table == "cast_list":
         # Update cast list
         castListId = input("\nWhat is the ID of the cast listing you would like to update? ")
 
-        # Set the where statement
-        where = f"WHERE castListId = {castListId}"
-
-        cursor.execute(f"SELECT showId, acId, type FROM {table} {where}")
+        cursor.execute(STATEMENTS[table]["select"], [castListId])
         # Get the first line of data, that's all we need
         currentinfo = cursor.fetchone()
 
@@ -578,16 +2103,36 @@ def update_data():
             type = currentinfo[2]
 
         # Set the tuple
-        values = [showId, acId, type]
-
-        # Set the query
-        query = f"SET showId = ?, acId = ?, type = ?"
+        values = [showId, acId, type, castListId]
+        # The listing may have moved from one show to another
+        showIds = [currentinfo[0], showId]
     else:
-        print("That table dos not exist. Check your spelling or add it to the database.")
+        print("That table does not exist. Check your spelling or add it to the database.")
+        return
+
+    # Store IDs as numbers, dates as days and times and types as IDs. The
+    # values are in update order, with the ID last.
+    try:
+        values = coerce_row(table, COLUMNS[table][1:] + COLUMNS[table][:1], values)
+    except ValueError as error:
+        print(error)
+        return
+    missing = names.missing(table, COLUMNS[table][1:] + COLUMNS[table][:1], values)
+    if missing:
+        print(missing)
+        return
 
     # Update data from specified table
-    cursor.execute(f"UPDATE {table} {query} {where}", values)
+    try:
+        cursor.execute(STATEMENTS[table]["update"], values)
+    except sqlite3.IntegrityError as error:
+        # Refused by a constraint, or by the rules from integrity.py --enforce on
+        connection.rollback()
+        print(error)
+        return
     connection.commit()
+    forget_cast_lists(table, showIds)
+    names.forget(table)
     print(f"\nUpdated data in the {table.upper()} table.")
 
 
@@ -601,20 +2146,9 @@ def query_data():
     view_table_option("shows")
     showId = input("\nWhat is the show ID you would like to see the cast list for? ")
 
-    cursor.execute(f"""
-                SELECT c.fname || ' ' || c.lname, a.fname || ' ' || a.lname, cl.type
-                FROM cast_list cl
-                INNER JOIN actor_is_char ac
-                ON cl.acId = ac.acId
-                INNER JOIN characters c
-                ON ac.charId = c.charId
-                INNER JOIN actors a
-                ON ac.actorId = a.actorId
-                WHERE showID = {showId}
-                """)
+    records = get_cast_list(showId)
     headers = ["Character", "Actor", "Cover Status"]
-    records = cursor.fetchall()
-    print(tabulate(records, headers, tablefmt="grid"))
+    render(records, headers)
 
 
 def main():
@@ -629,12 +2163,17 @@ def main():
         print("     3. Query data")
         print("     4. Delete data")
         print("     5. Update data")
-        print("     6. Exit")
+        print("     6. Search names")
+        print("     7. Exit")
         choice = int(input("> "))
 
         if choice == 1:
             table = input(("\nWhat table would you like to view? ")).lower()
-            view_data(table)
+            paged = input("View one page at a time (Y/N)? ").lower()
+            options = {}
+            if input("Sort or filter the data (Y/N)? ").lower() == "y":
+                options = view_options(table)
+            view_data(table, paged=(paged == "y"), **options)
         elif choice == 2:
             table = input("\nWhat table do you want to add to? ").lower()
             cont = input("Will you be adding more than one item (Y/N)? ").lower()
@@ -651,9 +2190,60 @@ def main():
         elif choice == 5:
             update_data()
         elif choice == 6:
+            search_option()
+        elif choice == 7:
             break
         else:
             print("Not a valid option.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Only needed when run from the command line, so importing the module
+    # doesn't pay for it
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Browse and edit the Legally Blonde database.")
+    parser.add_argument("--profile", choices=PROFILES, help="connection settings to use (default: LB_DB_PROFILE or interactive)")
+    parser.add_argument("--cast-view", choices=["on", "off"], help="keep a precomputed cast list table (show_cast_view) and read from it")
+    parser.add_argument("--log-sql", action="store_true", help="log every statement with its time and row count")
+    parser.add_argument("--slow-ms", type=float, help="log statements and renders at least this slow as warnings")
+    parser.add_argument("--explain", action="store_true", help="capture the query plan of each statement")
+    parser.add_argument("--trace-file", help="append a JSON line for every statement to this file")
+    parser.add_argument("--sql-stats", action="store_true", help="print the slowest statements on exit")
+    parser.add_argument("--output", choices=output.FORMATS, help="how to print tables (default: LB_OUTPUT or fixed)")
+    args = parser.parse_args()
+
+    if args.output:
+        output.DEFAULT_FORMAT = args.output
+
+    if args.log_sql or args.slow_ms is not None:
+        logging.basicConfig(level=logging.DEBUG if args.log_sql else logging.WARNING, format="%(message)s")
+    if args.slow_ms is not None:
+        profiling.SLOW_QUERY_SECONDS = args.slow_ms / 1000
+    if args.log_sql:
+        profiling.add_sink(profiling.LogSink())
+    elif args.slow_ms is not None:
+        profiling.add_sink(profiling.LogSink(), profiling.SLOW_QUERY_SECONDS)
+    profiling.explain_plans = args.explain
+    if args.trace_file:
+        profiling.add_sink(profiling.JsonFileSink(args.trace_file))
+    if args.sql_stats:
+        histogram = profiling.add_sink(profiling.HistogramSink())
+
+    if args.profile:
+        apply_profile(get_connection(), args.profile)
+    if args.cast_view == "on":
+        enable_cast_view()
+    elif args.cast_view == "off":
+        disable_cast_view()
+
+    try:
+        main()
+    finally:
+        if args.sql_stats:
+            if cursor is not None:
+                cursor.finish()
+            print("\nSlowest statements:")
+            summary = histogram.summary()[:10]
+            render([[stats["kind"], stats["count"], f"{stats['seconds'] * 1000:.1f}", f"{stats['max_seconds'] * 1000:.1f}",
+                     stats["rows"], stats["sql"][:80]] for stats in summary],
+                   ["Kind", "Count", "Total ms", "Max ms", "Rows", "Statement"])
@@ -0,0 +1,280 @@
+import argparse
+import csv
+import functools
+import gzip
+import io
+import json
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from database import CAST_VIEW_ROWS, COLUMNS, DB_PATH, cast_view_enabled, connect, initialize
+import parallel
+
+# Rows read from the database at a time, and rows in each columnar row group
+BATCH_SIZE = 10000
+
+# Name to export every show's cast list under
+CAST_LISTS = "cast_lists"
+CAST_LIST_COLUMNS = ["showId", "castListId", "charName", "actorName", "type"]
+
+FORMATS = {"csv": "csv", "jsonl": "jsonl", "columnar": "lbc", "parquet": "parquet"}
+
+# Start of every columnar file
+COLUMNAR_MAGIC = b"LBCOL1\n"
+
+
+def source(connection, name):
+    """
+    Get the columns and query for a table, or for every show's cast list.
+    """
+    if name == CAST_LISTS:
+        if cast_view_enabled(connection):
+            return CAST_LIST_COLUMNS, f"SELECT {', '.join(CAST_LIST_COLUMNS)} FROM show_cast_view ORDER BY showId, castListId"
+        return CAST_LIST_COLUMNS, f"{CAST_VIEW_ROWS} ORDER BY cl.showId, cl.castListId"
+    elif name in COLUMNS:
+        columns = COLUMNS[name]
+        return columns, f"SELECT {', '.join(columns)} FROM {name} ORDER BY {columns[0]}"
+    else:
+        raise ValueError(f"The {name} table does not exist.")
+
+
+def batches(cursor, batch_size=BATCH_SIZE):
+    """
+    Read the rows of a query a batch at a time, so only one batch is ever
+    in memory.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def write_csv(file, columns, row_batches):
+    writer = csv.writer(file)
+    writer.writerow(columns)
+    for rows in row_batches:
+        writer.writerows(rows)
+
+
+def write_jsonl(file, columns, row_batches):
+    for rows in row_batches:
+        file.write("".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows))
+
+
+def csv_text(rows):
+    """
+    Turn rows into CSV lines, returning how many rows there were and the
+    text. Used by the worker processes of a parallel export.
+    """
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return len(rows), text.getvalue()
+
+
+def jsonl_text(columns, rows):
+    return len(rows), "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def write_columnar(file, name, columns, row_batches):
+    """
+    Write rows column by column in row groups. Each column of each group is
+    a zlib compressed JSON list, which compresses far better than rows do
+    because the values in a column look alike.
+    """
+    header = json.dumps({"table": name, "columns": columns}).encode("utf-8")
+    file.write(COLUMNAR_MAGIC)
+    file.write(struct.pack("<I", len(header)))
+    file.write(header)
+
+    for rows in row_batches:
+        file.write(struct.pack("<I", len(rows)))
+        for values in zip(*rows):
+            block = zlib.compress(json.dumps(values).encode("utf-8"))
+            file.write(struct.pack("<I", len(block)))
+            file.write(block)
+
+    # A group with no rows marks the end of the file
+    file.write(struct.pack("<I", 0))
+
+
+def read_columnar(path):
+    """
+    Read back a columnar file. Yields the header, then each row.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar export.")
+        (length,) = struct.unpack("<I", file.read(4))
+        header = json.loads(file.read(length))
+        yield header
+
+        while True:
+            (count,) = struct.unpack("<I", file.read(4))
+            if count == 0:
+                return
+            values = []
+            for _ in header["columns"]:
+                (length,) = struct.unpack("<I", file.read(4))
+                values.append(json.loads(zlib.decompress(file.read(length))))
+            yield from zip(*values)
+
+
+def write_parquet(path, columns, row_batches):
+    """
+    Write a Parquet file, one row group per batch. Needs pyarrow.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow). Use the columnar format instead.")
+
+    writer = None
+    try:
+        for rows in row_batches:
+            table = pyarrow.table({column: list(values) for column, values in zip(columns, zip(*rows))})
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export(name, fmt, output_dir, compress=False, path=DB_PATH, workers=1):
+    """
+    Export a table (or "cast_lists") to a file in output_dir. With more than
+    one worker, ranges of IDs are read in that many processes at once.
+    Returns the file name and the number of rows written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}. Choose from: {', '.join(FORMATS)}")
+
+    # Each export reads from its own connection so they can run side by side
+    connection = connect(path, "read-mostly", read_only=True)
+    try:
+        columns, query = source(connection, name)
+        # CSV and JSONL are also written out in the workers, so all that's
+        # left here is adding their text to the file
+        transform = None
+        if workers > 1 and fmt == "csv":
+            transform = csv_text
+        elif workers > 1 and fmt == "jsonl":
+            transform = functools.partial(jsonl_text, columns)
+
+        if workers > 1 and name == CAST_LISTS:
+            row_batches = parallel.cast_lists(workers, path, transform)
+        elif workers > 1:
+            row_batches = parallel.table_rows(name, workers, path, transform)
+        else:
+            row_batches = batches(connection.execute(query))
+
+        # Count rows as they go past
+        total = 0
+
+        def counted(row_batches):
+            nonlocal total
+            for rows in row_batches:
+                total += len(rows)
+                yield rows
+
+        def counted_text(chunks):
+            nonlocal total
+            for count, text in chunks:
+                total += count
+                yield text
+
+        if transform is None:
+            row_batches = counted(row_batches)
+        out = os.path.join(output_dir, f"{name}.{FORMATS[fmt]}")
+
+        if fmt in ("csv", "jsonl"):
+            if compress:
+                out += ".gz"
+                file = gzip.open(out, "wt", encoding="utf-8", newline="")
+            else:
+                file = open(out, "w", encoding="utf-8", newline="")
+            with file:
+                if transform is not None:
+                    if fmt == "csv":
+                        csv.writer(file).writerow(columns)
+                    file.writelines(counted_text(row_batches))
+                elif fmt == "csv":
+                    write_csv(file, columns, row_batches)
+                else:
+                    write_jsonl(file, columns, row_batches)
+        elif fmt == "columnar":
+            # Already compressed column by column
+            with open(out, "wb") as file:
+                write_columnar(file, name, columns, row_batches)
+        else:
+            write_parquet(out, columns, row_batches)
+    finally:
+        connection.close()
+
+    return out, total
+
+
+def export_all(names, fmt, output_dir, compress=False, jobs=1, path=DB_PATH, workers=1):
+    """
+    Export several tables, in separate processes when jobs is more than one,
+    or one at a time split over workers processes each.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    if jobs <= 1:
+        for name in names:
+            report(name, *timed_export(name, fmt, output_dir, compress, path, workers))
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(timed_export, name, fmt, output_dir, compress, path) for name in names]
+        for name, future in zip(names, futures):
+            report(name, *future.result())
+
+
+def timed_export(name, fmt, output_dir, compress, path, workers=1):
+    start = time.perf_counter()
+    out, total = export(name, fmt, output_dir, compress, path, workers)
+    return out, total, time.perf_counter() - start
+
+
+def report(name, out, total, elapsed):
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"Exported {total} rows from {name.upper()} to {out} in {elapsed:.2f}s ({rate:,.0f} rows/sec).")
+
+
+def main():
+    names = list(COLUMNS) + [CAST_LISTS]
+
+    parser = argparse.ArgumentParser(description="Export tables and cast lists to files.")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help=f"tables to export, or {CAST_LISTS} for every show's cast list (default: all)")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="file format")
+    parser.add_argument("--output-dir", default="exports", help="directory to write the files to")
+    parser.add_argument("--gzip", action="store_true", help="gzip CSV and JSONL files")
+    parser.add_argument("--jobs", type=int, default=1, help="tables to export at once, each in its own process")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split each table between, by ranges of IDs")
+    parser.add_argument("--db", default=DB_PATH, help="database file to export from")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in names]
+    if unknown:
+        parser.error(f"unknown table {unknown[0]}. Choose from: {', '.join(names)}")
+    if args.jobs > 1 and args.workers > 1:
+        parser.error("use either --jobs or --workers, not both")
+
+    # Exports read through read-only connections, so create or upgrade the tables first
+    initialize(args.db)
+    try:
+        export_all(args.names or names, args.format, args.output_dir, args.gzip, args.jobs, args.db, args.workers)
+    except RuntimeError as error:
+        parser.exit(1, f"{error}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import sys
+import time
+
+import output
+from database import (COLUMNS, DB_PATH, DISPLAY_COLUMNS, change_log_enabled, connect, disable_change_log,
+                      enable_change_log, initialize, render)
+
+# Columns that shouldn't hold the same values in two rows of a table
+DUPLICATE_KEYS = {
+    "char_has_alias": ["charId", "aliasId"],
+    "actor_is_char": ["actorId", "charId"],
+    "shows": ["prodId", "date", "time", "location"],
+    "cast_list": ["showId", "acId"],
+}
+
+# What deleting a row does to the rows that refer to it when the rules are
+# enforced. Deleting a show or character takes its cast listings or alias
+# links with it. Anything else still in use can't be deleted.
+CASCADE = {
+    ("char_has_alias", "charId"),
+    ("char_has_alias", "aliasId"),
+    ("cast_list", "showId"),
+}
+
+# Past checks, so the next one can start from where the last one stopped.
+# A check that finds problems doesn't move on, so the next one finds them
+# again until they're fixed.
+CHECKS_TABLE = """
+        CREATE TABLE IF NOT EXISTS
+            integrity_checks (
+            checkId INTEGER PRIMARY KEY AUTOINCREMENT,
+            checkedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            seq INTEGER,
+            everything INTEGER NOT NULL,
+            orphans INTEGER NOT NULL,
+            duplicates INTEGER NOT NULL
+            )"""
+
+ORPHAN_HEADERS = ["Table", "ID", "Column", "Value", "Missing From"]
+DUPLICATE_HEADERS = ["Table", "Columns", "Values", "Rows", "IDs"]
+
+
+def relationships(connection):
+    """
+    Every foreign key in the schema, as (table, column, parent table,
+    parent column).
+    """
+    found = []
+    for table in COLUMNS:
+        for row in connection.execute(f"PRAGMA foreign_key_list({table})"):
+            found.append((table, row[3], row[2], row[4] or COLUMNS[row[2]][0]))
+    return found
+
+
+def changed_rows(table, operations):
+    """
+    SQL for the IDs of a table's rows logged with one of the operations
+    between :since and :until.
+    """
+    return f"""
+            SELECT rowId FROM change_log
+            WHERE tableName = '{table}' AND seq > :since AND seq <= :until
+            AND operation IN ({', '.join(f"'{operation}'" for operation in operations)})"""
+
+
+def find_orphans(connection, since=None, until=None):
+    """
+    Rows whose foreign keys point at rows that don't exist, found with one
+    anti-join per relationship. Given a range of change_log sequence
+    numbers, only rows written in it, or that referred to rows deleted in
+    it, are looked at.
+    """
+    orphans = []
+    for table, column, parent, parent_key in relationships(connection):
+        key = COLUMNS[table][0]
+        select = f"""
+                SELECT '{table}', c.{key}, '{column}', c.{column}, '{parent}'
+                FROM {table} c
+                WHERE c.{column} IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.{parent_key} = c.{column})"""
+        if since is None:
+            rows = connection.execute(select)
+        else:
+            # Either end of the relationship may have changed
+            rows = connection.execute(f"""
+                    {select} AND c.rowid IN ({changed_rows(table, ["insert", "update"])})
+                    UNION
+                    {select} AND c.{column} IN ({changed_rows(parent, ["delete"])})
+                    ORDER BY 2""", {"since": since, "until": until})
+        orphans.extend(rows)
+    return orphans
+
+
+def find_duplicates(connection, since=None, until=None):
+    """
+    Groups of rows holding the same DUPLICATE_KEYS values. Given a range of
+    change_log sequence numbers, only groups with a row written in it are
+    looked at.
+    """
+    duplicates = []
+    for table, columns in DUPLICATE_KEYS.items():
+        key = COLUMNS[table][0]
+        shown = " || ', ' || ".join(DISPLAY_COLUMNS.get((table, column), column) for column in columns)
+        where = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+        if since is not None:
+            where += f"""
+                    AND ({', '.join(columns)}) IN (
+                        SELECT {', '.join(columns)} FROM {table}
+                        WHERE rowid IN ({changed_rows(table, ["insert", "update"])})
+                    )"""
+        rows = connection.execute(f"""
+                SELECT '{table}', '{', '.join(columns)}', {shown}, COUNT(*), group_concat({key}, ', ')
+                FROM {table}
+                WHERE {where}
+                GROUP BY {', '.join(columns)}
+                HAVING COUNT(*) > 1""", {"since": since, "until": until})
+        duplicates.extend(rows)
+    return duplicates
+
+
+def last_check(connection):
+    """
+    The change_log sequence number the last check got up to, or None if
+    the next check has to look at everything.
+    """
+    if not change_log_enabled(connection):
+        return None
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'integrity_checks'").fetchone()
+    if row is None:
+        return None
+    row = connection.execute("SELECT seq FROM integrity_checks ORDER BY checkId DESC LIMIT 1").fetchone()
+    if row is None or row[0] is None:
+        return None
+    # Logging was off for a while since then, so some changes weren't logged
+    restarted = connection.execute("SELECT 1 FROM change_log WHERE operation = 'start' AND seq > ?", [row[0]]).fetchone()
+    return None if restarted else row[0]
+
+
+def check(path=DB_PATH, everything=False):
+    """
+    Look for orphans and duplicates, only in rows changed since the last
+    check that found none when the change log allows it. The checks read
+    one snapshot of the database through a read-only connection, so
+    writers carry on meanwhile.
+
+    Returns the orphans, the duplicates and whether everything was checked.
+    """
+    reader = connect(path, "read-mostly", read_only=True)
+    try:
+        # One read transaction, so every check sees the same snapshot
+        reader.execute("BEGIN")
+        since = None if everything else last_check(reader)
+        until = None
+        if change_log_enabled(reader):
+            until = reader.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        orphans = find_orphans(reader, since, until)
+        duplicates = find_duplicates(reader, since, until)
+        reader.rollback()
+    finally:
+        reader.close()
+
+    # Problems found in rows changed before until would be missed by a
+    # check starting there, so only move on once there are none
+    seq = since if orphans or duplicates else until
+    writer = connect(path)
+    try:
+        writer.execute(CHECKS_TABLE)
+        writer.execute("INSERT INTO integrity_checks (seq, everything, orphans, duplicates) VALUES (?, ?, ?, ?)",
+                       [seq, since is None, len(orphans), len(duplicates)])
+        writer.commit()
+    finally:
+        writer.close()
+    return orphans, duplicates, since is None
+
+
+def enable_rules(connection):
+    """
+    Add triggers that stop rows pointing at rows that don't exist, that
+    cascade or stop deletes of rows still in use, and that stop the IDs of
+    rows in use changing.
+    """
+    disable_rules(connection)
+    for table, column, parent, parent_key in relationships(connection):
+        missing = f"new.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {parent} WHERE {parent_key} = new.{column})"
+        message = f"{table}.{column} has no matching row in {parent.upper()}"
+        connection.execute(f"""
+                CREATE TRIGGER integrity_{table}_{column}_insert BEFORE INSERT ON {table} WHEN {missing}
+                BEGIN SELECT RAISE(ABORT, '{message}'); END""")
+        connection.execute(f"""
+                CREATE TRIGGER integrity_{table}_{column}_update BEFORE UPDATE OF {column} ON {table} WHEN {missing}
+                BEGIN SELECT RAISE(ABORT, '{message}'); END""")
+        if (table, column) in CASCADE:
+            connection.execute(f"""
+                    CREATE TRIGGER integrity_{parent}_{table}_{column}_delete AFTER DELETE ON {parent}
+                    BEGIN DELETE FROM {table} WHERE {column} = old.{parent_key}; END""")
+        else:
+            connection.execute(f"""
+                    CREATE TRIGGER integrity_{parent}_{table}_{column}_delete BEFORE DELETE ON {parent}
+                    WHEN EXISTS (SELECT 1 FROM {table} WHERE {column} = old.{parent_key})
+                    BEGIN SELECT RAISE(ABORT, '{parent} row still used by {table}.{column}'); END""")
+        connection.execute(f"""
+                CREATE TRIGGER integrity_{parent}_{table}_{column}_key BEFORE UPDATE OF {parent_key} ON {parent}
+                WHEN new.{parent_key} IS NOT old.{parent_key}
+                AND EXISTS (SELECT 1 FROM {table} WHERE {column} = old.{parent_key})
+                BEGIN SELECT RAISE(ABORT, '{parent} row still used by {table}.{column}'); END""")
+    connection.commit()
+
+
+def disable_rules(connection):
+    """
+    Remove the triggers added by enable_rules().
+    """
+    names = connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'integrity\\_%' ESCAPE '\\'")
+    for (name,) in names.fetchall():
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look for rows pointing at missing rows, and for duplicate rows.")
+    parser.add_argument("--everything", action="store_true", help="check every row, not just those changed since the last check")
+    parser.add_argument("--change-log", choices=["on", "off"],
+                        help="log every write to change_log, so checks only need to look at the rows changed since the last one")
+    parser.add_argument("--enforce", choices=["on", "off"],
+                        help="add triggers that refuse missing references and cascade or refuse deletes of rows in use")
+    parser.add_argument("--no-check", action="store_true", help="only change the settings above")
+    parser.add_argument("--output", choices=output.FORMATS, help="how to print problems (default: LB_OUTPUT or fixed)")
+    parser.add_argument("--db", default=DB_PATH, help="database file to check")
+    args = parser.parse_args()
+
+    if args.output:
+        output.DEFAULT_FORMAT = args.output
+
+    # Checks read through a read-only connection, so create or upgrade the tables first
+    initialize(args.db)
+    if args.change_log or args.enforce:
+        connection = connect(args.db)
+        if args.change_log == "on":
+            enable_change_log(connection)
+        elif args.change_log == "off":
+            disable_change_log(connection)
+        if args.enforce == "on":
+            enable_rules(connection)
+        elif args.enforce == "off":
+            disable_rules(connection)
+        connection.close()
+    if args.no_check:
+        return
+
+    start = time.perf_counter()
+    orphans, duplicates, everything = check(args.db, args.everything)
+    elapsed = time.perf_counter() - start
+
+    if orphans:
+        render(orphans, ORPHAN_HEADERS)
+    if duplicates:
+        render(duplicates, DUPLICATE_HEADERS)
+    checked = "every row" if everything else "rows changed since the last check"
+    print(f"Checked {checked} in {elapsed:.2f}s: {len(orphans)} orphans, {len(duplicates)} duplicates.", file=sys.stderr)
+    if orphans or duplicates:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sqlite3
+
+# Tables whose size is worth reporting
+TABLES = ["shows", "cast_list"]
+
+
+def file_size(path):
+    """
+    Size of a database file and its write-ahead log.
+    """
+    return sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name))
+
+
+def table_sizes(connection):
+    """
+    Bytes of pages used by each table and its indexes, or None when SQLite
+    was built without the dbstat table.
+    """
+    try:
+        rows = connection.execute("""
+                    SELECT COALESCE(i.tbl_name, d.name), SUM(d.pgsize)
+                    FROM dbstat d
+                    LEFT JOIN sqlite_master i
+                    ON d.name = i.name AND i.type = 'index'
+                    GROUP BY 1
+                    """).fetchall()
+    except sqlite3.Error:
+        return None
+    return {name: size for name, size in rows if name in TABLES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a database file to the current schema and compact it.")
+    parser.add_argument("--db", default="legally-blonde.db", help="database file to upgrade")
+    parser.add_argument("--no-vacuum", action="store_true", help="don't rewrite the file to give back the space freed")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} doesn't exist")
+
+    before = sqlite3.connect(args.db)
+    version = before.execute("PRAGMA user_version").fetchone()[0]
+    sizes = table_sizes(before)
+    before.close()
+    size = file_size(args.db)
+
+    # The database module upgrades the file when it connects, so point it
+    # at the file first
+    os.environ["LB_DB_PATH"] = args.db
+    import database
+    connection = database.get_connection()
+
+    if version >= database.SCHEMA_VERSION:
+        print(f"{args.db} is already at schema version {version}.")
+    else:
+        print(f"Upgraded {args.db} from schema version {version} to {database.SCHEMA_VERSION}.")
+
+    if not args.no_vacuum:
+        connection.execute("VACUUM")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    new_sizes = table_sizes(connection)
+    if sizes is not None and new_sizes is not None:
+        for table in TABLES:
+            print(f"{table.upper()}: {sizes.get(table, 0):,} bytes -> {new_sizes.get(table, 0):,} bytes")
+    print(f"File: {size:,} bytes -> {file_size(args.db):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
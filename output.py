@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+from abc import ABC, abstractmethod
+
+import profiling
+
+# Ways of printing tables. fixed is the default, and can be changed with
+# the LB_OUTPUT environment variable.
+FORMATS = ["fixed", "grid", "tsv", "json"]
+DEFAULT_FORMAT = os.environ.get("LB_OUTPUT", "fixed")
+
+# Rows looked at to work out the column widths of a fixed-width table
+SAMPLE_ROWS = 100
+
+# Space between fixed-width columns
+COLUMN_GAP = "  "
+
+
+def cell_text(value):
+    return "" if value is None else str(value)
+
+
+def padded_text(value):
+    # Spaces around values would throw the columns out
+    return "" if value is None else str(value).strip()
+
+
+class Table(ABC):
+    """
+    Print rows under a set of headers, a batch at a time, so a table can be
+    printed as it's read without holding all of it. Each format says how
+    to print a batch in write_rows().
+    """
+
+    def __init__(self, headers, widths=None, out=None):
+        self.headers = list(headers)
+        self.widths = widths or {}
+        self.out = out or sys.stdout
+        self.label = f"{type(self).__name__} {', '.join(self.headers)}"
+
+    def write(self, rows):
+        with profiling.timed("render", self.label, len(rows)):
+            self.write_rows(rows)
+
+    @abstractmethod
+    def write_rows(self, rows):
+        pass
+
+    def close(self):
+        self.out.flush()
+
+
+class FixedWidthTable(Table):
+    """
+    Columns padded to a fixed width, worked out from the width hints and
+    the first batch of rows. Later cells that don't fit push the rest of
+    their row over rather than being cut off.
+    """
+
+    def __init__(self, headers, widths=None, out=None):
+        super().__init__(headers, widths, out)
+        self.line = None
+
+    def start(self, sample):
+        widths = []
+        aligns = []
+        for index, header in enumerate(self.headers):
+            values = [row[index] for row in sample if row[index] is not None]
+            widths.append(max([len(header), self.widths.get(header, 0)] + [len(padded_text(value)) for value in values]))
+            # Right-align columns of numbers
+            numeric = values and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values)
+            aligns.append(">" if numeric else "<")
+
+        self.line = COLUMN_GAP.join(f"{{:{align}{width}}}" for align, width in zip(aligns, widths)) + "\n"
+        self.out.write(COLUMN_GAP.join(header.ljust(width) for header, width in zip(self.headers, widths)).rstrip() + "\n")
+        self.out.write(COLUMN_GAP.join("-" * width for width in widths) + "\n")
+
+    def write_rows(self, rows):
+        if self.line is None:
+            self.start(rows[:SAMPLE_ROWS])
+        line = self.line
+        self.out.write("".join(line.format(*map(padded_text, row)).rstrip() + "\n" for row in rows))
+
+    def close(self):
+        # Always show the headers, even with no rows
+        if self.line is None:
+            self.start([])
+        super().close()
+
+
+class GridTable(Table):
+    """
+    The boxed grid tabulate draws, one grid per batch of rows since
+    tabulate needs every row to size the columns.
+    """
+
+    def __init__(self, headers, widths=None, out=None):
+        super().__init__(headers, widths, out)
+        self.drawn = False
+
+    def write_rows(self, rows):
+        # Imported here since only this format needs it
+        from tabulate import tabulate
+
+        self.out.write(tabulate(rows, self.headers, tablefmt="grid") + "\n")
+        self.drawn = True
+
+    def close(self):
+        # Always show the headers, even with no rows
+        if not self.drawn:
+            self.write_rows([])
+        super().close()
+
+
+class TsvTable(Table):
+    """
+    Tab separated values with a header line. Tabs, newlines and backslashes
+    in values are written as \\t, \\n and \\\\.
+    """
+
+    def __init__(self, headers, widths=None, out=None):
+        super().__init__(headers, widths, out)
+        self.out.write("\t".join(self.headers) + "\n")
+
+    def write_rows(self, rows):
+        self.out.write("".join("\t".join(map(tsv_text, row)) + "\n" for row in rows))
+
+
+def tsv_text(value):
+    return cell_text(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class JsonTable(Table):
+    """
+    One JSON object per row, keyed by the headers.
+    """
+
+    def write_rows(self, rows):
+        headers = self.headers
+        self.out.write("".join(json.dumps(dict(zip(headers, row)), default=str) + "\n" for row in rows))
+
+
+TABLES = {
+    "fixed": FixedWidthTable,
+    "grid": GridTable,
+    "tsv": TsvTable,
+    "json": JsonTable,
+}
+
+
+def open_table(headers, fmt=None, widths=None, out=None):
+    """
+    Start printing a table. Write batches of rows to it, then close it.
+    widths gives the least width of some columns by header, for formats
+    that line columns up.
+    """
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt not in TABLES:
+        raise ValueError(f"Unknown output format {fmt}. Choose from: {', '.join(FORMATS)}")
+    return TABLES[fmt](headers, widths, out)
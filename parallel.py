@@ -0,0 +1,119 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from database import CAST_VIEW_ROWS, COLUMNS, DB_PATH, cast_view_enabled, connect
+
+# Rows in each range of IDs. Only a couple of ranges per worker are held in
+# memory at once, however big the table is, and having many more ranges
+# than workers means workers that finish early pick up more of the work.
+RANGE_ROWS = 50000
+
+# The read-only connection of each worker process
+worker_connection = None
+
+
+def open_worker(path):
+    """
+    Open the connection a worker process uses for every range it runs.
+    """
+    global worker_connection
+    worker_connection = connect(path, "read-mostly", read_only=True)
+
+
+def run_range(sql, params, low, high, transform):
+    rows = worker_connection.execute(sql, dict(params, low=low, high=high)).fetchall()
+    return rows if transform is None else transform(rows)
+
+
+def key_ranges(connection, table, key, rows=RANGE_ROWS):
+    """
+    Split the IDs of a table into ranges of about the given number of rows,
+    as (low, high) pairs with high left out. Gaps in the IDs don't matter,
+    but an ID with more rows than that still gets a range of its own.
+    """
+    low, last = connection.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}").fetchone()
+    ranges = []
+    while low is not None:
+        # Step through the index to the ID rows further on
+        row = connection.execute(f"SELECT {key} FROM {table} WHERE {key} >= ? ORDER BY {key} LIMIT 1 OFFSET ?",
+                                 [low, rows]).fetchone()
+        if row is not None and row[0] == low:
+            row = connection.execute(f"SELECT MIN({key}) FROM {table} WHERE {key} > ?", [low]).fetchone()
+        high = last + 1 if row is None or row[0] is None else row[0]
+        ranges.append((low, high))
+        low = high if high <= last else None
+    return ranges
+
+
+def parallel_query(sql, table, key, params=None, workers=None, path=DB_PATH, transform=None):
+    """
+    Run a query once for each range of a table's IDs, spread over worker
+    processes, and yield each range's rows in order. The query must only
+    pick rows with :low <= ID < :high and sort them, e.g.
+
+        SELECT ... FROM cast_list WHERE showId >= :low AND showId < :high ORDER BY showId
+
+    so the ranges put together come out in order too. If transform is
+    given, it's called on each range's rows in the worker and its result is
+    yielded instead. It has to be a module level function (or a partial of
+    one) so it can be sent to the workers.
+
+    Each range is read in its own transaction, so the rows aren't one
+    snapshot of the database. Rows written while the query runs may show up
+    in ranges read after the write but not in those read before it.
+    """
+    workers = workers or os.cpu_count() or 1
+    params = params or {}
+
+    connection = connect(path, "read-mostly", read_only=True)
+    try:
+        ranges = key_ranges(connection, table, key)
+    finally:
+        connection.close()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=open_worker, initargs=(path,)) as executor:
+        # Keep a couple of ranges per worker running ahead of the one being
+        # read, so only those are ever held in memory
+        pending = deque()
+        for low, high in ranges:
+            pending.append(executor.submit(run_range, sql, params, low, high, transform))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def cast_lists(workers=None, path=DB_PATH, transform=None):
+    """
+    Every show's cast list as (showId, castListId, charName, actorName,
+    type) rows in show order, worked out in parallel by ranges of show IDs.
+    Yields a list of rows per range.
+    """
+    connection = connect(path, "read-mostly", read_only=True)
+    try:
+        use_view = cast_view_enabled(connection)
+    finally:
+        connection.close()
+
+    if use_view:
+        sql = """
+                SELECT showId, castListId, charName, actorName, type FROM show_cast_view
+                WHERE showId >= :low AND showId < :high ORDER BY showId, castListId
+                """
+    else:
+        sql = f"{CAST_VIEW_ROWS} AND cl.showId >= :low AND cl.showId < :high ORDER BY cl.showId, cl.castListId"
+    return parallel_query(sql, "cast_list", "showId", workers=workers, path=path, transform=transform)
+
+
+def table_rows(table, workers=None, path=DB_PATH, transform=None):
+    """
+    Every row of a table in ID order, read in parallel by ranges of IDs.
+    Yields a list of rows per range.
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"The {table} table does not exist.")
+    columns = COLUMNS[table]
+    key = columns[0]
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE {key} >= :low AND {key} < :high ORDER BY {key}"
+    return parallel_query(sql, table, key, workers=workers, path=path, transform=transform)
@@ -0,0 +1,296 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Statements at least this slow are marked as slow. Can be set in
+# milliseconds with the LB_SLOW_QUERY_MS environment variable.
+SLOW_QUERY_SECONDS = float(os.environ.get("LB_SLOW_QUERY_MS", "100")) / 1000
+
+# Whether to capture EXPLAIN QUERY PLAN output for each statement. Running
+# the plan costs an extra statement, so it's off unless asked for.
+explain_plans = False
+
+# Sinks receiving a record for every statement and render, as
+# (sink, minimum seconds) pairs
+sinks = []
+
+logger = logging.getLogger("legally_blonde.sql")
+
+# Statements that EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def add_sink(sink, min_seconds=0):
+    """
+    Send records to a sink, a function taking one record (a dict). Only
+    records at least min_seconds long are sent, so passing
+    SLOW_QUERY_SECONDS gives a sink that only sees slow statements.
+    Statements are only recorded on connections opened after the first
+    sink is added.
+    """
+    sinks.append((sink, min_seconds))
+    return sink
+
+
+def remove_sink(sink):
+    sinks[:] = [(other, min_seconds) for other, min_seconds in sinks if other is not sink]
+
+
+def emit(record):
+    """
+    Pass a finished record on to every sink that wants it.
+    """
+    record["slow"] = record["seconds"] >= SLOW_QUERY_SECONDS
+    for sink, min_seconds in sinks:
+        if record["seconds"] >= min_seconds:
+            sink(record)
+
+
+def explain(connection, sql, parameters=()):
+    """
+    Get the EXPLAIN QUERY PLAN output for a statement as a list of lines.
+    """
+    # Use a plain cursor so the plan itself isn't recorded
+    cursor = sqlite3.Cursor(connection)
+    try:
+        sqlite3.Cursor.execute(cursor, f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in sqlite3.Cursor.fetchall(cursor)]
+    except sqlite3.Error:
+        return []
+    finally:
+        cursor.close()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    A cursor that times each statement, counts the rows it returns and
+    records it once all of its rows have been read. Only times statements
+    while there are sinks.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.record = None
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        if not sinks:
+            return super().execute(sql, parameters)
+
+        record = {"kind": "query", "sql": " ".join(sql.split()), "rows": 0}
+        if explain_plans and record["sql"].upper().startswith(EXPLAINABLE):
+            record["plan"] = explain(self.connection, sql, parameters)
+
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        record["seconds"] = time.perf_counter() - start
+        self.record = record
+
+        # Nothing to read back, so the statement is already done
+        if self.description is None:
+            record["rows"] = max(self.rowcount, 0)
+            self.finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        if not sinks:
+            return super().executemany(sql, seq_of_parameters)
+
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        emit({"kind": "query", "sql": " ".join(sql.split()), "rows": max(self.rowcount, 0),
+              "seconds": time.perf_counter() - start})
+        return self
+
+    def fetchone(self):
+        if self.record is None:
+            return super().fetchone()
+
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.record["seconds"] += time.perf_counter() - start
+        if row is None:
+            self.finish()
+        else:
+            self.record["rows"] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        if self.record is None:
+            return super().fetchmany(size)
+
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self.record["seconds"] += time.perf_counter() - start
+        self.record["rows"] += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        if self.record is None:
+            return super().fetchall()
+
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.record["seconds"] += time.perf_counter() - start
+        self.record["rows"] += len(rows)
+        self.finish()
+        return rows
+
+    def __next__(self):
+        if self.record is None:
+            return super().__next__()
+
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.record["seconds"] += time.perf_counter() - start
+            self.finish()
+            raise
+        self.record["seconds"] += time.perf_counter() - start
+        self.record["rows"] += 1
+        return row
+
+    def finish(self):
+        """
+        Record the current statement if it hasn't been already.
+        """
+        if self.record is not None:
+            record = self.record
+            self.record = None
+            emit(record)
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        # Statements whose rows were never all read are recorded here
+        self.finish()
+
+
+class Connection(sqlite3.Connection):
+    """
+    A plain connection, for when nothing is profiled. Unlike
+    sqlite3.Connection, it can have attributes set on it.
+    """
+
+
+class ProfiledConnection(Connection):
+    """
+    A connection whose cursors are all ProfiledCursors.
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """
+    The connection class to open connections with. Timing every statement
+    and row costs something even with nobody listening, so connections
+    are only profiled once a sink has been added.
+    """
+    return ProfiledConnection if sinks else Connection
+
+
+@contextmanager
+def timed(kind, label, rows=0):
+    """
+    Record how long the code in a with block takes, e.g. rendering a table.
+    """
+    if not sinks:
+        yield
+        return
+
+    start = time.perf_counter()
+    yield
+    emit({"kind": kind, "sql": label, "rows": rows, "seconds": time.perf_counter() - start})
+
+
+class LogSink:
+    """
+    Log each record, with slow ones as warnings.
+    """
+
+    def __init__(self, logger=logger):
+        self.logger = logger
+
+    def __call__(self, record):
+        level = logging.WARNING if record["slow"] else logging.DEBUG
+        self.logger.log(level, "%s %.3fms %d rows: %s", record["kind"], record["seconds"] * 1000, record["rows"],
+                        record["sql"])
+        for line in record.get("plan", []):
+            self.logger.log(level, "    %s", line)
+
+
+class HistogramSink:
+    """
+    Keep timings for each statement in memory, bucketed by powers of two
+    milliseconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def __call__(self, record):
+        milliseconds = record["seconds"] * 1000
+        bucket = 0 if milliseconds < 1 else 2 ** math.ceil(math.log2(milliseconds))
+        with self.lock:
+            stats = self.stats.setdefault((record["kind"], record["sql"]), {
+                "count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "slow": 0, "buckets": {},
+            })
+            stats["count"] += 1
+            stats["seconds"] += record["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], record["seconds"])
+            stats["rows"] += record["rows"]
+            stats["slow"] += record["slow"]
+            stats["buckets"][bucket] = stats["buckets"].get(bucket, 0) + 1
+            if "plan" in record:
+                stats["plan"] = record["plan"]
+
+    def summary(self):
+        """
+        Get the statements that took the most time overall, slowest first.
+        Each bucket counts the runs that took up to that many milliseconds.
+        """
+        with self.lock:
+            rows = [dict(stats, kind=kind, sql=sql, buckets=dict(sorted(stats["buckets"].items())))
+                    for (kind, sql), stats in self.stats.items()]
+        return sorted(rows, key=lambda stats: stats["seconds"], reverse=True)
+
+
+class JsonFileSink:
+    """
+    Append each record to a file as one line of JSON.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        line = json.dumps(dict(record, time=time.time()))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
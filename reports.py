@@ -0,0 +1,445 @@
+import argparse
+
+import database
+import output
+from database import render, sql_date, to_days
+
+# Summary tables of running counts, kept up to date by triggers once
+# enable_summaries() has been run
+SUMMARY_TABLES = {
+    "summary_appearances": """
+        CREATE TABLE IF NOT EXISTS
+            summary_appearances (
+            acId INTEGER PRIMARY KEY,
+            appearances INTEGER NOT NULL
+            )""",
+    "summary_covers": """
+        CREATE TABLE IF NOT EXISTS
+            summary_covers (
+            prodId INTEGER NOT NULL,
+            type INTEGER NOT NULL,
+            appearances INTEGER NOT NULL,
+            PRIMARY KEY (prodId, type)
+            ) WITHOUT ROWID""",
+    "summary_years": """
+        CREATE TABLE IF NOT EXISTS
+            summary_years (
+            prodId INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            shows INTEGER NOT NULL,
+            matinees INTEGER NOT NULL,
+            evenings INTEGER NOT NULL,
+            PRIMARY KEY (prodId, year)
+            ) WITHOUT ROWID""",
+}
+
+# Statements adding a cast listing to the counts, and taking it away
+ADD_LISTING = """
+            INSERT INTO summary_appearances (acId, appearances) SELECT new.acId, 1 WHERE new.acId IS NOT NULL
+            ON CONFLICT (acId) DO UPDATE SET appearances = appearances + 1;
+            INSERT INTO summary_covers (prodId, type, appearances)
+            SELECT prodId, new.type, 1 FROM shows WHERE showId = new.showId AND prodId IS NOT NULL AND new.type IS NOT NULL
+            ON CONFLICT (prodId, type) DO UPDATE SET appearances = appearances + 1;"""
+REMOVE_LISTING = """
+            UPDATE summary_appearances SET appearances = appearances - 1 WHERE acId = old.acId;
+            UPDATE summary_covers SET appearances = appearances - 1
+            WHERE type = old.type AND prodId = (SELECT prodId FROM shows WHERE showId = old.showId);"""
+
+# Statements moving all of a show's listings to or from its production
+ADD_SHOW = """
+            INSERT INTO summary_covers (prodId, type, appearances)
+            SELECT new.prodId, type, COUNT(*) FROM cast_list
+            WHERE showId = new.showId AND type IS NOT NULL AND new.prodId IS NOT NULL GROUP BY type
+            ON CONFLICT (prodId, type) DO UPDATE SET appearances = appearances + excluded.appearances;"""
+REMOVE_SHOW = """
+            UPDATE summary_covers SET appearances = appearances - (
+                SELECT COUNT(*) FROM cast_list WHERE showId = old.showId AND type = summary_covers.type
+            ) WHERE prodId = old.prodId;"""
+
+
+def show_year(days):
+    """
+    SQL for the year of a date stored as days.
+    """
+    return f"CAST(substr({sql_date(days)}, 1, 4) AS INTEGER)"
+
+
+def is_time(time, code):
+    """
+    SQL that's 1 if a show time is the one with the code and 0 otherwise.
+    """
+    return f"({time} IS (SELECT timeId FROM show_times WHERE code = '{code}'))"
+
+
+# Statements adding a show to its production's year, and taking it away
+ADD_YEAR = f"""
+            INSERT INTO summary_years (prodId, year, shows, matinees, evenings)
+            SELECT new.prodId, {show_year("new.date")}, 1, {is_time("new.time", "M")}, {is_time("new.time", "E")}
+            WHERE new.prodId IS NOT NULL AND new.date IS NOT NULL
+            ON CONFLICT (prodId, year) DO UPDATE SET shows = shows + 1, matinees = matinees + excluded.matinees,
+            evenings = evenings + excluded.evenings;"""
+REMOVE_YEAR = f"""
+            UPDATE summary_years SET shows = shows - 1, matinees = matinees - {is_time("old.time", "M")},
+            evenings = evenings - {is_time("old.time", "E")}
+            WHERE prodId = old.prodId AND year = {show_year("old.date")};"""
+
+SUMMARY_TRIGGERS = {
+    "summary_cast_list_insert": f"AFTER INSERT ON cast_list BEGIN {ADD_LISTING} END",
+    "summary_cast_list_update": f"AFTER UPDATE ON cast_list BEGIN {REMOVE_LISTING} {ADD_LISTING} END",
+    "summary_cast_list_delete": f"AFTER DELETE ON cast_list BEGIN {REMOVE_LISTING} END",
+    "summary_shows_insert": f"AFTER INSERT ON shows BEGIN {ADD_SHOW} END",
+    "summary_shows_update": f"AFTER UPDATE OF showId, prodId ON shows BEGIN {REMOVE_SHOW} {ADD_SHOW} END",
+    "summary_shows_delete": f"AFTER DELETE ON shows BEGIN {REMOVE_SHOW} END",
+    "summary_years_insert": f"AFTER INSERT ON shows BEGIN {ADD_YEAR} END",
+    "summary_years_update": f"AFTER UPDATE OF prodId, date, time ON shows BEGIN {REMOVE_YEAR} {ADD_YEAR} END",
+    "summary_years_delete": f"AFTER DELETE ON shows BEGIN {REMOVE_YEAR} END",
+}
+
+# Queries that count everything from scratch, used to fill the summaries
+# and whenever they aren't turned on
+APPEARANCE_COUNTS = "SELECT acId, COUNT(*) AS appearances FROM cast_list WHERE acId IS NOT NULL GROUP BY acId"
+COVER_COUNTS = """
+            SELECT s.prodId AS prodId, cl.type AS type, COUNT(*) AS appearances
+            FROM cast_list cl
+            INNER JOIN shows s
+            ON cl.showId = s.showId
+            WHERE cl.type IS NOT NULL AND s.prodId IS NOT NULL
+            GROUP BY s.prodId, cl.type"""
+YEAR_COUNTS = f"""
+            SELECT prodId, {show_year("date")} AS year, COUNT(*) AS shows, SUM({is_time("time", "M")}) AS matinees,
+            SUM({is_time("time", "E")}) AS evenings
+            FROM shows
+            WHERE prodId IS NOT NULL AND date IS NOT NULL
+            GROUP BY prodId, year"""
+
+
+def summaries_enabled(connection=None):
+    """
+    Check whether the database has the summary tables.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary_covers'").fetchone()
+    return row is not None
+
+
+def enable_summaries(connection=None):
+    """
+    Create and fill the summary tables, and add the triggers that keep them
+    up to date as cast lists and shows change.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    for create in SUMMARY_TABLES.values():
+        connection.execute(create)
+    connection.execute("DELETE FROM summary_appearances")
+    connection.execute(f"INSERT INTO summary_appearances (acId, appearances) {APPEARANCE_COUNTS}")
+    connection.execute("DELETE FROM summary_covers")
+    connection.execute(f"INSERT INTO summary_covers (prodId, type, appearances) {COVER_COUNTS}")
+    connection.execute("DELETE FROM summary_years")
+    connection.execute(f"INSERT INTO summary_years (prodId, year, shows, matinees, evenings) {YEAR_COUNTS}")
+    for name, trigger in SUMMARY_TRIGGERS.items():
+        connection.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}")
+    connection.commit()
+
+
+def disable_summaries(connection=None):
+    """
+    Remove the summary tables and their triggers.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    for name in SUMMARY_TRIGGERS:
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for name in SUMMARY_TABLES:
+        connection.execute(f"DROP TABLE IF EXISTS {name}")
+    connection.commit()
+
+
+def appearances(connection=None, actorId=None, charId=None, limit=None):
+    """
+    How many times each actor has played each character, most first.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    if summaries_enabled(connection):
+        counts = "SELECT acId, appearances FROM summary_appearances WHERE appearances > 0"
+    else:
+        counts = APPEARANCE_COUNTS
+
+    # Count first, then look up names for just the counted rows
+    cursor = connection.execute(f"""
+                SELECT a.fname || ' ' || a.lname, c.fname || ' ' || c.lname, counts.appearances
+                FROM ({counts}) counts
+                INNER JOIN actor_is_char ac
+                ON counts.acId = ac.acId
+                INNER JOIN actors a
+                ON ac.actorId = a.actorId
+                INNER JOIN characters c
+                ON ac.charId = c.charId
+                WHERE (:actorId IS NULL OR ac.actorId = :actorId) AND (:charId IS NULL OR ac.charId = :charId)
+                ORDER BY counts.appearances DESC, a.lname, a.fname
+                LIMIT :limit
+                """, {"actorId": actorId, "charId": charId, "limit": -1 if limit is None else limit})
+    return ["Actor", "Character", "Appearances"], cursor.fetchall()
+
+
+def covers(connection=None, prodId=None, limit=None):
+    """
+    How often each kind of cover went on in each production, with how often
+    that is per 100 shows.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    if summaries_enabled(connection):
+        counts = "SELECT prodId, type, appearances FROM summary_covers WHERE appearances > 0"
+    else:
+        counts = COVER_COUNTS
+
+    cursor = connection.execute(f"""
+                SELECT p.prodName, ct.type, counts.appearances, round(100.0 * counts.appearances / runs.shows, 1)
+                FROM ({counts}) counts
+                INNER JOIN cover_types ct
+                ON counts.type = ct.typeId
+                INNER JOIN productions p
+                ON counts.prodId = p.prodId
+                INNER JOIN (SELECT prodId, COUNT(*) AS shows FROM shows GROUP BY prodId) runs
+                ON counts.prodId = runs.prodId
+                WHERE ct.type != 'actor' AND (:prodId IS NULL OR counts.prodId = :prodId)
+                ORDER BY p.prodName, counts.appearances DESC
+                LIMIT :limit
+                """, {"prodId": prodId, "limit": -1 if limit is None else limit})
+    return ["Production", "Cover Status", "Appearances", "Per 100 Shows"], cursor.fetchall()
+
+
+def locations(connection=None, year=None, limit=None):
+    """
+    How many shows were played at each location each year.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    where = ""
+    params = []
+    if year is not None:
+        # Dates are stored as days, so a year is a range of the date index
+        where = "WHERE date >= ? AND date < ?"
+        params = [to_days(f"{year}-01-01"), to_days(f"{int(year) + 1}-01-01")]
+
+    cursor = connection.execute(f"""
+                SELECT substr({sql_date("date")}, 1, 4) AS year, location, COUNT(*)
+                FROM shows
+                {where}
+                GROUP BY year, location
+                ORDER BY year, location
+                LIMIT ?
+                """, params + [-1 if limit is None else limit])
+    return ["Year", "Location", "Shows"], cursor.fetchall()
+
+
+def runs(connection=None, prodId=None, limit=None):
+    """
+    First and last show, and the number of shows, matinees and evenings, for
+    each production.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    cursor = connection.execute(f"""
+                SELECT p.prodName, {sql_date("runs.first")}, {sql_date("runs.last")}, runs.shows, runs.matinees,
+                runs.evenings
+                FROM (
+                    SELECT prodId, MIN(date) AS first, MAX(date) AS last, COUNT(*) AS shows,
+                    SUM(time = (SELECT timeId FROM show_times WHERE code = 'M')) AS matinees,
+                    SUM(time = (SELECT timeId FROM show_times WHERE code = 'E')) AS evenings
+                    FROM shows
+                    WHERE :prodId IS NULL OR prodId = :prodId
+                    GROUP BY prodId
+                ) runs
+                INNER JOIN productions p
+                ON runs.prodId = p.prodId
+                ORDER BY runs.first
+                LIMIT :limit
+                """, {"prodId": prodId, "limit": -1 if limit is None else limit})
+    return ["Production", "First Show", "Last Show", "Shows", "Matinees", "Evenings"], cursor.fetchall()
+
+
+def years(connection=None, prodId=None, limit=None):
+    """
+    How many shows, matinees and evenings each production played each year.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    # Databases that had summaries before this table existed don't have it
+    # until the summaries are turned on again
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary_years'").fetchone()
+    if row is not None:
+        counts = "SELECT prodId, year, shows, matinees, evenings FROM summary_years WHERE shows > 0"
+    else:
+        counts = YEAR_COUNTS
+
+    cursor = connection.execute(f"""
+                SELECT p.prodName, counts.year, counts.shows, counts.matinees, counts.evenings
+                FROM ({counts}) counts
+                INNER JOIN productions p
+                ON counts.prodId = p.prodId
+                WHERE :prodId IS NULL OR counts.prodId = :prodId
+                ORDER BY counts.year, p.prodName
+                LIMIT :limit
+                """, {"prodId": prodId, "limit": -1 if limit is None else limit})
+    return ["Production", "Year", "Shows", "Matinees", "Evenings"], cursor.fetchall()
+
+
+def period_start(text):
+    """
+    Days of the first day of a YYYY, YYYY-MM or YYYY-MM-DD period.
+    """
+    parts = str(text).strip().split("-")
+    try:
+        return to_days("-".join(parts + ["01"] * (3 - len(parts))))
+    except ValueError:
+        raise ValueError(f"{text!r} isn't a date. Use YYYY, YYYY-MM or YYYY-MM-DD.")
+
+
+def period_end(text):
+    """
+    Days of the day after the last day of a YYYY, YYYY-MM or YYYY-MM-DD
+    period, so "2008-03" ends before 2008-04-01.
+    """
+    # Checks the period is a real one, like 2008-12 but not 2008-13
+    start = period_start(text)
+    parts = str(text).strip().split("-")
+    if len(parts) == 1 and parts[0].isdigit():
+        return period_start(int(parts[0]) + 1)
+    if len(parts) == 2 and parts[1].isdigit():
+        year, month = int(parts[0]), int(parts[1])
+        return period_start(f"{year + month // 12}-{month % 12 + 1:02d}")
+    return start + 1
+
+
+def date_range(start=None, end=None):
+    """
+    The days from the start of one period to the end of another, either of
+    which can be left open.
+    """
+    return (None if start is None else period_start(start), None if end is None else period_end(end))
+
+
+def timeline(connection=None, start=None, end=None, location=None, prodId=None, limit=None):
+    """
+    Every show between two dates (YYYY, YYYY-MM or YYYY-MM-DD, both
+    included), in order. Only the shows in the range are read, through the
+    date and location index.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    first, last = date_range(start, end)
+    cursor = connection.execute(f"""
+                SELECT s.showId, p.prodName, {sql_date("s.date")}, st.code, s.location
+                FROM shows s
+                LEFT JOIN productions p
+                ON s.prodId = p.prodId
+                LEFT JOIN show_times st
+                ON s.time = st.timeId
+                WHERE s.date >= :first AND s.date < :last
+                AND (:location IS NULL OR s.location = :location) AND (:prodId IS NULL OR s.prodId = :prodId)
+                ORDER BY s.date, s.time, s.showId
+                LIMIT :limit
+                """, {"first": -2 ** 63 if first is None else first, "last": 2 ** 63 - 1 if last is None else last,
+                      "location": location, "prodId": prodId, "limit": -1 if limit is None else limit})
+    return ["ID", "Production", "Date", "Time", "Location"], cursor.fetchall()
+
+
+def performances(connection=None, actorId=None, charId=None, start=None, end=None, limit=None):
+    """
+    Every show an actor, or a character, was in between two dates, in order.
+    """
+    if connection is None:
+        connection = database.get_connection()
+    if actorId is None and charId is None:
+        raise ValueError("Choose an actor or a character.")
+    first, last = date_range(start, end)
+    # Start from the actor's or character's cast listings, then keep the
+    # shows in the range
+    cursor = connection.execute(f"""
+                SELECT s.showId, {sql_date("s.date")}, st.code, s.location, a.fname || ' ' || a.lname,
+                c.fname || ' ' || c.lname, ct.type
+                FROM actor_is_char ac
+                INNER JOIN cast_list cl
+                ON cl.acId = ac.acId
+                INNER JOIN shows s
+                ON cl.showId = s.showId
+                INNER JOIN actors a
+                ON ac.actorId = a.actorId
+                INNER JOIN characters c
+                ON ac.charId = c.charId
+                LEFT JOIN show_times st
+                ON s.time = st.timeId
+                LEFT JOIN cover_types ct
+                ON cl.type = ct.typeId
+                WHERE (:actorId IS NULL OR ac.actorId = :actorId) AND (:charId IS NULL OR ac.charId = :charId)
+                AND s.date >= :first AND s.date < :last
+                ORDER BY s.date, s.time, s.showId
+                LIMIT :limit
+                """, {"actorId": actorId, "charId": charId, "first": -2 ** 63 if first is None else first,
+                      "last": 2 ** 63 - 1 if last is None else last, "limit": -1 if limit is None else limit})
+    return ["ID", "Date", "Time", "Location", "Actor", "Character", "Cover Status"], cursor.fetchall()
+
+
+REPORTS = {
+    "appearances": appearances,
+    "covers": covers,
+    "locations": locations,
+    "runs": runs,
+    "years": years,
+    "timeline": timeline,
+    "performances": performances,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print reports over the cast lists and shows.")
+    parser.add_argument("report", nargs="?", choices=REPORTS, help="report to print")
+    parser.add_argument("--actorId", type=int, help="only this actor (appearances, performances)")
+    parser.add_argument("--charId", type=int, help="only this character (appearances, performances)")
+    parser.add_argument("--prodId", type=int, help="only this production (covers, runs, years, timeline)")
+    parser.add_argument("--year", type=int, help="only this year (locations)")
+    parser.add_argument("--from", dest="start", help="first date, month or year to include (timeline, performances)")
+    parser.add_argument("--to", dest="end", help="last date, month or year to include (timeline, performances)")
+    parser.add_argument("--location", help="only shows at this location (timeline)")
+    parser.add_argument("--limit", type=int, help="most rows to show")
+    parser.add_argument("--summaries", choices=["on", "off"], help="keep running counts in summary tables and read from them")
+    parser.add_argument("--output", choices=output.FORMATS, help="how to print the report (default: LB_OUTPUT or fixed)")
+    args = parser.parse_args()
+
+    if args.output:
+        output.DEFAULT_FORMAT = args.output
+
+    if args.summaries == "on":
+        enable_summaries()
+    elif args.summaries == "off":
+        disable_summaries()
+    if args.report is None:
+        if args.summaries is None:
+            parser.error("choose a report")
+        return
+
+    options = {"limit": args.limit}
+    if args.report == "appearances":
+        options.update(actorId=args.actorId, charId=args.charId)
+    elif args.report in ("covers", "runs", "years"):
+        options.update(prodId=args.prodId)
+    elif args.report == "locations":
+        options.update(year=args.year)
+    elif args.report == "timeline":
+        options.update(start=args.start, end=args.end, location=args.location, prodId=args.prodId)
+    elif args.report == "performances":
+        options.update(actorId=args.actorId, charId=args.charId, start=args.start, end=args.end)
+
+    try:
+        headers, records = REPORTS[args.report](**options)
+    except ValueError as error:
+        parser.error(str(error))
+    render(records, headers)
+
+
+if __name__ == "__main__":
+    main()
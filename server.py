@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from database import (CAST_LIST_QUERY, CAST_VIEW_QUERY, COLUMNS, DB_PATH, PAGE_SIZE, STATEMENTS, cast_cache,
+                      cast_view_enabled, connect, initialize)
+
+# Largest page a client can ask for
+MAX_PAGE_SIZE = 1000
+
+
+class ConnectionPool:
+    """
+    A fixed number of read-only connections shared by the request threads.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(connect(path, "read-mostly", read_only=True))
+        # The version of the files the cached cast lists were read from,
+        # and whether the database had the cast view then
+        self.cached_version = None
+        self.cast_view = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        # Wait for a free connection so we never open more than the pool size
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    def version(self):
+        """
+        Get the time of the last write to the database, along with a tag
+        that changes whenever the database or its WAL file does.
+        """
+        modified_ns = 0
+        stats = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            modified_ns = max(modified_ns, stat.st_mtime_ns)
+            stats.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        return modified_ns, "/".join(stats)
+
+    def check_version(self, version):
+        """
+        Drop the cached cast lists once the files have changed, since other
+        programs write to them.
+        """
+        with self.lock:
+            if version != self.cached_version:
+                cast_cache.clear()
+                self.cast_view = None
+                self.cached_version = version
+
+
+def page_params(params):
+    """
+    The after and limit of a table page request.
+    """
+    after = int(params.get("after", ["0"])[0])
+    limit = int(params.get("limit", [str(PAGE_SIZE)])[0])
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return after, limit
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET requests for table pages and show cast lists as JSON.
+
+        /tables                           names of the tables
+        /tables/<table>?after=ID&limit=N  a page of rows, ordered by ID
+        /shows/<showId>/cast              cast list for a show
+    """
+
+    pool = None
+    # Keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        params = parse_qs(url.query)
+
+        # Work out what's asked for first, so bad requests are refused
+        # whatever their conditional headers say
+        try:
+            if parts == ["tables"]:
+                answer = lambda: {"tables": list(COLUMNS)}
+            elif len(parts) == 2 and parts[0] == "tables" and parts[1] in COLUMNS:
+                after, limit = page_params(params)
+                answer = lambda: self.table_page(parts[1], after, limit)
+            elif len(parts) == 3 and parts[0] == "shows" and parts[2] == "cast":
+                showId = int(parts[1])
+                answer = lambda: self.cast_list(showId)
+            else:
+                self.send_json(404, {"error": "Not found"})
+                return
+        except ValueError as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        # Nothing changes unless the database files do, so answer repeat
+        # requests without touching SQLite
+        modified_ns, version = self.pool.version()
+        self.pool.check_version(version)
+        etag = '"' + hashlib.sha1(f"{version}:{self.path}".encode()).hexdigest() + '"'
+        last_modified = formatdate(modified_ns / 1e9, usegmt=True)
+        if self.not_modified(etag, modified_ns):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return
+
+        self.send_json(200, answer(), {"ETag": etag, "Last-Modified": last_modified})
+
+    def not_modified(self, etag, modified_ns):
+        """
+        Check the request's conditional headers against the current version.
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            # HTTP dates only have whole seconds
+            return int(modified_ns / 1e9) <= since
+        return False
+
+    def table_page(self, table, after, limit):
+        """
+        Get one page of a table, starting after the given ID.
+        """
+        with self.pool.connection() as connection:
+            rows = connection.execute(STATEMENTS[table]["page"], [after, limit]).fetchall()
+
+        # The ID is always the first column
+        next_after = rows[-1][0] if len(rows) == limit else None
+        return {"table": table, "columns": COLUMNS[table], "rows": rows, "next": next_after}
+
+    def cast_list(self, showId):
+        """
+        Get the cast list for a show, from the cache if it's been read since
+        the database last changed.
+        """
+        rows = cast_cache.get(showId)
+        if rows is None:
+            generation = cast_cache.generation
+            with self.pool.connection() as connection:
+                if self.pool.cast_view is None:
+                    self.pool.cast_view = cast_view_enabled(connection)
+                query = CAST_VIEW_QUERY if self.pool.cast_view else CAST_LIST_QUERY
+                rows = tuple(connection.execute(query, [showId]).fetchall())
+            cast_cache.put(showId, rows, generation)
+
+        cast = [{"character": character, "actor": actor, "type": type} for character, actor, type in rows]
+        return {"showId": showId, "cast": cast}
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the database as a read-only JSON API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--db", default=DB_PATH, help="database file to serve")
+    parser.add_argument("--pool-size", type=int, default=os.cpu_count() or 4, help="number of read-only connections")
+    args = parser.parse_args()
+
+    # The pool's connections are read-only, so create or upgrade the tables first
+    initialize(args.db)
+    RequestHandler.pool = ConnectionPool(args.db, args.pool_size)
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    print(f"Serving {args.db} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import os
+import time
+
+import integrity
+from database import (COLUMNS, DB_PATH, change_log_enabled, connect, disable_change_log, enable_change_log,
+                      get_qmarks, initialize)
+
+# Order to apply changes in, with tables before the tables that refer to
+# them. Deletes go the other way round.
+SYNC_ORDER = ["productions", "show_times", "cover_types", "characters", "alias", "actors",
+              "char_has_alias", "actor_is_char", "shows", "cast_list"]
+
+# Where a replica got up to, kept in the replica
+SYNC_STATE_TABLE = """
+        CREATE TABLE IF NOT EXISTS
+            sync_state (
+            seq INTEGER NOT NULL,
+            syncedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )"""
+
+
+def replica_seq(replica):
+    """
+    The change_log sequence number a replica has every change up to, or
+    None if it has never been synced.
+    """
+    row = replica.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_state'").fetchone()
+    if row is None:
+        return None
+    row = replica.execute("SELECT seq FROM sync_state").fetchone()
+    return row[0] if row else None
+
+
+def set_replica_seq(replica, seq):
+    replica.execute(SYNC_STATE_TABLE)
+    replica.execute("DELETE FROM sync_state")
+    replica.execute("INSERT INTO sync_state (seq) VALUES (?)", [seq])
+
+
+def can_apply_changes(source, since, until):
+    """
+    Check whether the change log still has every change after since. It
+    doesn't when logging was off for a while, or the log was cleared.
+    """
+    if since is None or since > until:
+        return False
+    if since and source.execute("SELECT 1 FROM change_log WHERE seq = ?", [since]).fetchone() is None:
+        return False
+    restarted = source.execute("SELECT 1 FROM change_log WHERE operation = 'start' AND seq > ?", [since]).fetchone()
+    return restarted is None
+
+
+def copy_database(path, replica):
+    """
+    Copy the whole database into a replica. The copy keeps the derived
+    tables and their triggers, but not the triggers that log changes or
+    enforce rules, since the replica only changes through syncs.
+    Returns the sequence number the copy is up to.
+    """
+    source = connect(path, "read-mostly", read_only=True)
+    try:
+        source.backup(replica)
+    finally:
+        source.close()
+
+    disable_change_log(replica)
+    integrity.disable_rules(replica)
+    seq = replica.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    set_replica_seq(replica, seq)
+    replica.commit()
+    return seq
+
+
+def apply_changes(source, replica, since, until):
+    """
+    Bring a replica from since up to until. Only the latest version of each
+    changed row is copied, so a row changed many times is written once.
+    Returns the number of rows written and deleted.
+    """
+    upserts = {}
+    deletes = {}
+    for table in SYNC_ORDER:
+        columns = ", ".join(COLUMNS[table])
+        changed = """
+                SELECT rowId FROM change_log
+                WHERE tableName = ? AND seq > ? AND seq <= ?"""
+        ids = {row[0] for row in source.execute(f"SELECT DISTINCT rowId FROM ({changed})", [table, since, until])}
+        upserts[table] = source.execute(f"SELECT {columns} FROM {table} WHERE rowid IN ({changed})",
+                                        [table, since, until]).fetchall()
+        # Rows that are gone now
+        deletes[table] = [(id,) for id in ids - {row[0] for row in upserts[table]}]
+
+    written = 0
+    deleted = 0
+    replica.execute("BEGIN")
+    try:
+        for table in reversed(SYNC_ORDER):
+            if deletes[table]:
+                replica.executemany(f"DELETE FROM {table} WHERE {COLUMNS[table][0]} = ?", deletes[table])
+                deleted += len(deletes[table])
+        for table in SYNC_ORDER:
+            if upserts[table]:
+                key, *others = COLUMNS[table]
+                # An upsert rather than INSERT OR REPLACE, so the replica's
+                # own triggers see an update instead of a silent delete
+                replica.executemany(f"""
+                        INSERT INTO {table} ({', '.join(COLUMNS[table])}) VALUES ({get_qmarks(COLUMNS[table])})
+                        ON CONFLICT ({key}) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in others)}
+                        """, upserts[table])
+                written += len(upserts[table])
+        set_replica_seq(replica, until)
+        replica.commit()
+    except Exception:
+        replica.rollback()
+        raise
+    return written, deleted
+
+
+def sync(path, replica_path):
+    """
+    Bring a replica file up to date with the database, copying only the
+    rows changed since its last sync when the change log allows it, and
+    the whole file otherwise.
+
+    Returns how it was done ("changes", "copy" or "current"), the sequence
+    number the replica is now up to, and the rows written and deleted.
+    """
+    writer = connect(path)
+    try:
+        # Changes from here on are logged, and this first sync copies everything
+        if not change_log_enabled(writer):
+            enable_change_log(writer)
+    finally:
+        writer.close()
+
+    replica = connect(replica_path)
+    try:
+        source = connect(path, "read-mostly", read_only=True)
+        try:
+            # One read transaction, so the rows match the log they're read with
+            source.execute("BEGIN")
+            until = source.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+            since = replica_seq(replica)
+            if since == until:
+                return "current", until, 0, 0
+            if can_apply_changes(source, since, until):
+                written, deleted = apply_changes(source, replica, since, until)
+                return "changes", until, written, deleted
+        finally:
+            source.close()
+        return "copy", copy_database(path, replica), None, None
+    finally:
+        replica.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the changes made to the database since the last sync into replica files.")
+    parser.add_argument("replicas", nargs="+", metavar="REPLICA", help="replica files to bring up to date (made if missing)")
+    parser.add_argument("--db", default=DB_PATH, help="database file to copy from")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} doesn't exist")
+    initialize(args.db)
+
+    for replica in args.replicas:
+        start = time.perf_counter()
+        how, seq, written, deleted = sync(args.db, replica)
+        milliseconds = (time.perf_counter() - start) * 1000
+        if how == "current":
+            print(f"{replica} is already up to date (change {seq}).")
+        elif how == "changes":
+            print(f"Updated {replica} to change {seq} in {milliseconds:.1f}ms: {written} rows written, {deleted} deleted.")
+        else:
+            print(f"Copied {args.db} to {replica} (change {seq}) in {milliseconds:.1f}ms.")
+
+
+if __name__ == "__main__":
+    main()